@@ -1,7 +1,7 @@
 # backend/api/admin.py - FIXED VERSION
 from fastapi import APIRouter, HTTPException, Query
-from services.incident_service import incident_service
-from services.kb_service import kb_service
+from services.incident_service import incident_service, DEFAULT_ADMIN_MESSAGES
+from services.kb_service import kb_service, kb_writer, decode_list_metadata
 from db.chroma import chroma_client
 from db.mongo import mongo_client
 from models.schemas import KBApprovalRequest
@@ -20,7 +20,7 @@ router = APIRouter(prefix="/api/admin", tags=["admin"])
 async def get_stats():
     """Get dashboard statistics"""
     try:
-        all_incidents = incident_service.get_all_incidents()
+        all_incidents = incident_service.get_incident_flags()
         
         stats = {
             "total": len(all_incidents),
@@ -44,19 +44,9 @@ async def get_incidents(
 ):
     """Get all incidents with optional filters - newest first"""
     try:
-        # Get all incidents (already sorted by MongoDB)
-        incidents = incident_service.get_all_incidents()
-        logger.info(f"Total incidents found: {len(incidents)}")
-        
-        # Apply status filter if provided
-        if status:
-            incidents = [inc for inc in incidents if inc.get('status') == status]
-            logger.info(f"After status filter '{status}': {len(incidents)} incidents")
-        
-        # Filter by KB approval if requested
-        if needs_kb_approval is not None:
-            incidents = [inc for inc in incidents if inc.get('needs_kb_approval') == needs_kb_approval]
-            logger.info(f"After KB approval filter '{needs_kb_approval}': {len(incidents)} incidents")
+        # Filters run in MongoDB against the (status, needs_kb_approval) index
+        incidents = incident_service.get_filtered_incidents(status, needs_kb_approval)
+        logger.info(f"Incidents found (status={status}, needs_kb_approval={needs_kb_approval}): {len(incidents)}")
         
         # Add use_case field for display if missing
         for incident in incidents:
@@ -149,13 +139,7 @@ async def update_admin_message(incident_id: str, request: Dict[str, str]):
         
         # If message is empty, set appropriate default based on status
         if not admin_message:
-            default_messages = {
-                'pending_info': 'Still need some information.',
-                'open': 'All information collected. Our team will contact you soon.',
-                'resolved': 'Incident has been resolved successfully.',
-                'closed': 'Incident has been closed.'
-            }
-            admin_message = default_messages.get(incident.get('status', ''), '')
+            admin_message = DEFAULT_ADMIN_MESSAGES.get(incident.get('status', ''), '')
         
         success = mongo_client.update_incident(incident_id, {
             'admin_message': admin_message,
@@ -210,6 +194,7 @@ async def delete_incident(incident_id: str):
     try:
         from db.mongo import mongo_client
         result = mongo_client.incidents_collection.delete_one({'incident_id': incident_id})
+        mongo_client.invalidate_incident(incident_id)
         
         if result.deleted_count > 0:
             return {"message": "Incident deleted successfully", "incident_id": incident_id}
@@ -354,7 +339,7 @@ async def force_update_kb_file():
             required_info = metadata.get('required_info', '')
             if required_info:
                 file_content += "Required Info:\n"
-                for info in required_info.split(','):
+                for info in decode_list_metadata(required_info):
                     file_content += f"- {info.strip()}\n"
                 file_content += "\n"
             
@@ -371,10 +356,7 @@ async def force_update_kb_file():
         
         # Write to file
         kb_file_path = kb_service.kb_file_path
-        os.makedirs(os.path.dirname(kb_file_path), exist_ok=True)
-        
-        with open(kb_file_path, 'w', encoding='utf-8') as f:
-            f.write(file_content)
+        kb_service.rewrite_kb_file(file_content)
         
         # Verify the write
         with open(kb_file_path, 'r', encoding='utf-8') as f:
@@ -455,6 +437,7 @@ async def delete_chroma_entry(kb_id: str):
     try:
         # 1. First delete from ChromaDB
         success = chroma_client.delete_entry(kb_id)
+        kb_service.invalidate_kb_entry(kb_id)
         
         if not success:
             raise HTTPException(status_code=400, detail="Failed to delete KB entry from ChromaDB")
@@ -500,7 +483,7 @@ async def sync_kb_file_with_chroma():
             required_info = metadata.get('required_info', '')
             if required_info:
                 file_content += "Required Info:\n"
-                for info in required_info.split(','):
+                for info in decode_list_metadata(required_info):
                     file_content += f"- {info.strip()}\n"
                 file_content += "\n"
             
@@ -517,10 +500,7 @@ async def sync_kb_file_with_chroma():
         
         # Write to file
         kb_file_path = kb_service.kb_file_path
-        os.makedirs(os.path.dirname(kb_file_path), exist_ok=True)
-        
-        with open(kb_file_path, 'w', encoding='utf-8') as f:
-            f.write(file_content)
+        kb_service.rewrite_kb_file(file_content)
         
         # Verify the write
         with open(kb_file_path, 'r', encoding='utf-8') as f:
@@ -539,6 +519,18 @@ async def sync_kb_file_with_chroma():
         return {"error": str(e)}
 
 
+@router.post("/kb/checkpoint")
+def checkpoint_kb_file():
+    """Write out queued KB appends and fsync kb_data.txt"""
+    try:
+        flushed = kb_writer.flush(timeout=5)
+        synced = kb_service.checkpoint()
+        return {"flushed": flushed, "synced": synced, "file_path": kb_service.kb_file_path}
+    except Exception as e:
+        logger.error(f"Error checkpointing KB file: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @router.get("/kb/force-sync")
 async def force_sync_kb():
     """Force synchronization between ChromaDB and kb_data.txt"""
@@ -695,7 +687,7 @@ async def debug_test_kb_search(query: str = "outlook not opening"):
     """Test KB search functionality"""
     try:
         logger.info(f"Testing KB search with query: {query}")
-        result = kb_service.search_kb(query)
+        result = kb_service.search_kb(query, return_all=True)
         
         return {
             "query": query,
@@ -1,7 +1,12 @@
 #backend/api/chat.py
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from models.schemas import UserQuery, IncidentResponse
 from services.incident_service import incident_service
+from typing import Any, Dict, Optional
+import asyncio
+import json
 import logging
 from services.llm_service import llm_service
 
@@ -11,43 +16,50 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
 
+def _build_response(result: Optional[Dict[str, Any]], query: UserQuery) -> IncidentResponse:
+    """Normalize a process_user_query result into the API response model"""
+    # ✅ FIX: Check if result is None and handle it
+    if result is None:
+        logger.error("process_user_query returned None - returning error response")
+        result = {
+            'message': "I apologize, but I encountered an error processing your request. Please try again.",
+            'session_id': query.session_id or "",
+            'incident_id': None,
+            'status': 'error'
+        }
+    
+    # Ensure all fields are present
+    response_data = {
+        'message': result.get('message', ''),
+        'incident_id': result.get('incident_id'),
+        'session_id': result.get('session_id', query.session_id or ""),
+        'status': result.get('status'),
+        'action': result.get('action'),
+        'show_action_buttons': result.get('show_action_buttons', False),
+        'action_buttons': result.get('action_buttons', None)
+    }
+    
+    logger.info(f"Sending response with buttons: {response_data.get('show_action_buttons')}")
+    if response_data.get('action_buttons'):
+        logger.info(f"Button data: {response_data.get('action_buttons')}")
+    
+    return IncidentResponse(**response_data)
+
+
 @router.post("/query", response_model=IncidentResponse)
 async def process_query(query: UserQuery):
     """
     Process user query and return response
     """
     try:
-        result = incident_service.process_user_query(
+        # Mongo and Gemini calls are blocking; keep them off the event loop
+        result = await run_in_threadpool(
+            incident_service.process_user_query,
             query.user_input,
             query.session_id
         )
         
-        # ✅ FIX: Check if result is None and handle it
-        if result is None:
-            logger.error("process_user_query returned None - returning error response")
-            result = {
-                'message': "I apologize, but I encountered an error processing your request. Please try again.",
-                'session_id': query.session_id or "",
-                'incident_id': None,
-                'status': 'error'
-            }
-        
-        # Ensure all fields are present
-        response_data = {
-            'message': result.get('message', ''),
-            'incident_id': result.get('incident_id'),
-            'session_id': result.get('session_id', query.session_id or ""),
-            'status': result.get('status'),
-            'action': result.get('action'),
-            'show_action_buttons': result.get('show_action_buttons', False),
-            'action_buttons': result.get('action_buttons', None)
-        }
-        
-        logger.info(f"Sending response with buttons: {response_data.get('show_action_buttons')}")
-        if response_data.get('action_buttons'):
-            logger.info(f"Button data: {response_data.get('action_buttons')}")
-        
-        return IncidentResponse(**response_data)
+        return _build_response(result, query)
         
     except Exception as e:
         logger.error(f"Error in process_query: {e}")
@@ -66,6 +78,46 @@ async def process_query(query: UserQuery):
         return IncidentResponse(**error_response)
 
 
+@router.post("/query/stream")
+async def process_query_stream(query: UserQuery):
+    """
+    Process user query as server-sent events: "token" events carry reply text as
+    the LLM produces it, and a final "done" event carries the full response
+    """
+    loop = asyncio.get_running_loop()
+    tokens: asyncio.Queue = asyncio.Queue()
+    
+    def on_token(text: str):
+        # Called from the worker thread
+        loop.call_soon_threadsafe(tokens.put_nowait, text)
+    
+    async def events():
+        task = asyncio.ensure_future(run_in_threadpool(
+            incident_service.process_user_query,
+            query.user_input,
+            query.session_id,
+            on_token
+        ))
+        while True:
+            getter = asyncio.ensure_future(tokens.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                break
+            yield f"event: token\ndata: {json.dumps(getter.result())}\n\n"
+        while not tokens.empty():
+            yield f"event: token\ndata: {json.dumps(tokens.get_nowait())}\n\n"
+        
+        try:
+            result = task.result()
+        except Exception as e:
+            logger.exception(f"Error in process_query_stream: {e}")
+            result = None
+        yield f"event: done\ndata: {_build_response(result, query).model_dump_json()}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @router.get("/session/{session_id}/history")
 async def get_session_history(session_id: str):
     """
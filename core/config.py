@@ -14,6 +14,13 @@ class Settings(BaseSettings):
     SESSION_COLLECTION: str = os.getenv("SESSION_COLLECTION", "sessions")
     KB_COLLECTION: str = os.getenv("KB_COLLECTION", "kb_entries")
     
+    # MongoDB connection pool - keep warm connections around between bursts of requests
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+    # Wire compression for remote clusters; PyMongo skips any codec that isn't installed
+    MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+    
     # Environment Detection
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
     RENDER: str = os.getenv("RENDER", "false")
@@ -45,6 +52,8 @@ class Settings(BaseSettings):
     JINA_API_KEY: str = os.getenv("JINA_API_KEY", "")
 
     JINA_MODEL: str = "jina-embeddings-v2-base-en"
+    # Embedding requests kept in flight at once when a large batch is split into chunks
+    EMBEDDING_WORKERS: int = int(os.getenv("EMBEDDING_WORKERS", "4"))
     
     # LLM settings
     LLM_MODEL: str = "gemini-2.0-flash"
@@ -53,6 +62,12 @@ class Settings(BaseSettings):
     CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", "./db/chroma")
     CHROMA_DIR: str = os.getenv("CHROMA_DIR", "./db/chroma")  # For compatibility
     
+    # Knowledge base source file; resolved once here instead of probing the filesystem
+    KB_FILE_PATH: str = os.path.abspath(os.getenv(
+        "KB_FILE_PATH",
+        os.path.join(os.path.dirname(__file__), "..", "knowledge_base", "docs", "kb_data.txt")
+    ))
+    
     # Application Settings
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -5,14 +5,18 @@ from core.config import settings
 from typing import List, Dict, Any, Optional
 import logging
 import os
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+KB_COLLECTION = "kb_knowledge_base"
+
 
 class ChromaDBClient:
     def __init__(self):
         self.client = None
         self.collection = None
+        self.distance_space = "cosine"
         
     def connect(self):
         """Initialize ChromaDB client"""
@@ -25,11 +29,16 @@ class ChromaDBClient:
                 settings=ChromaSettings(anonymized_telemetry=False)
             )
             
-            # Get or create collection
-            self.collection = self.client.get_or_create_collection(
-                name="kb_knowledge_base",
-                metadata={"description": "Knowledge base for incident management"}
-            )
+            # New collections use cosine distance. An existing collection keeps the space it
+            # was built with (ChromaDB's default is squared L2), which cannot be changed in place
+            if KB_COLLECTION in {collection.name for collection in self.client.list_collections()}:
+                self.collection = self.client.get_collection(name=KB_COLLECTION)
+            else:
+                self.collection = self.client.create_collection(
+                    name=KB_COLLECTION,
+                    metadata={"description": "Knowledge base for incident management", "hnsw:space": "cosine"}
+                )
+            self.distance_space = (self.collection.metadata or {}).get("hnsw:space", "l2")
             
             logger.info("Connected to ChromaDB successfully")
         except Exception as e:
@@ -51,6 +60,24 @@ class ChromaDBClient:
             logger.error(f"Error adding KB entry: {e}")
             return False
     
+    def add_kb_entries_batch(self, ids: List[str], texts: List[str], embeddings: List[List[float]],
+                             metadatas: List[Dict[str, Any]]) -> bool:
+        """Add several knowledge base entries in one call"""
+        if not ids:
+            return True
+        try:
+            self.collection.add(
+                ids=ids,
+                embeddings=embeddings,
+                documents=texts,
+                metadatas=metadatas
+            )
+            logger.info(f"Added {len(ids)} KB entries")
+            return True
+        except Exception as e:
+            logger.error(f"Error adding KB entries: {e}")
+            return False
+    
     def search_similar(self, query_embedding: List[float], n_results: int = 3) -> Dict[str, Any]:
         """Search for similar entries"""
         try:
@@ -63,6 +90,15 @@ class ChromaDBClient:
             logger.error(f"Error searching ChromaDB: {e}")
             return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
     
+    def distances_to_similarities(self, distances: List[float]) -> np.ndarray:
+        """Cosine similarities for a query's distances, whatever space the collection uses"""
+        distances = np.asarray(distances, dtype=np.float32)
+        if self.distance_space == "l2":
+            # Embeddings are unit length, so squared L2 = 2 - 2*cosine
+            return 1.0 - distances / 2.0
+        # cosine and ip distances are both 1 - dot product
+        return 1.0 - distances
+    
     def get_entry_by_id(self, kb_id: str) -> Optional[Dict[str, Any]]:
         """Get entry by KB ID"""
         try:
@@ -93,14 +129,13 @@ class ChromaDBClient:
             logger.error(f"Error updating KB entry: {e}")
             return False
     
-    def delete_entry(self, kb_id: str):
-        """Delete a KB entry"""
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> bool:
+        """Replace the metadata of existing entries, keeping documents and embeddings"""
         try:
-            self.collection.delete(ids=[kb_id])
-            logger.info(f"Deleted KB entry: {kb_id}")
+            self.collection.update(ids=ids, metadatas=metadatas)
             return True
         except Exception as e:
-            logger.error(f"Error deleting KB entry: {e}")
+            logger.error(f"Error updating KB metadata: {e}")
             return False
     
     def get_all_entries(self) -> List[Dict[str, Any]]:
@@ -1,22 +1,47 @@
 # backend/db/mongo.py
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateOne
 from pymongo.errors import ConnectionFailure
+import bson
 from core.config import settings
 from typing import Optional, Dict, List, Any
 from datetime import datetime
+from collections import OrderedDict
+import copy
 import logging
+import numpy as np
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+INCIDENT_CACHE_SIZE = 2048
+INCIDENT_CACHE_TTL = 30  # seconds
+SESSION_CACHE_SIZE = 1024
+SESSION_CACHE_TTL = 5  # seconds
+
 class MongoDBClient:
     def __init__(self):
         self.client: Optional[MongoClient] = None
         self.db = None
         self.incidents_collection = None
         self.sessions_collection = None
+        self.counters_collection = None
+        self.embedding_cache_collection = None
+        self.pending_kb_collection = None
+        # LRU of incident documents with a short TTL, keyed by incident_id
+        self._incident_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._incident_cache_lock = threading.RLock()
+        # LRU of session reads with a short TTL: session_id -> (expires_at, {projection key: document})
+        self._session_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._session_cache_lock = threading.RLock()
         
     def connect(self):
         """Connect to MongoDB with environment-aware SSL support"""
+        # One MongoClient (and connection pool) per process; repeated startup hooks reuse it
+        if self.client is not None:
+            logger.info("♻️ Reusing existing MongoDB client")
+            return
+        
         try:
             logger.info(f"🔌 Connecting to MongoDB...")
             logger.info(f"   Environment: {'PRODUCTION' if settings.is_production else 'DEVELOPMENT'}")
@@ -31,9 +56,11 @@ class MongoDBClient:
                     tls=True,
                     retryWrites=True,
                     w='majority',
+                    compressors=settings.MONGO_COMPRESSORS,
                     serverSelectionTimeoutMS=30000,
                     connectTimeoutMS=30000,
-                    socketTimeoutMS=30000
+                    socketTimeoutMS=30000,
+                    **self._pool_options()
                 )
             else:
                 # Local Docker development
@@ -44,9 +71,14 @@ class MongoDBClient:
                     directConnection=True,
                     serverSelectionTimeoutMS=5000,
                     connectTimeoutMS=10000,
-                    socketTimeoutMS=10000
+                    socketTimeoutMS=10000,
+                    **self._pool_options()
                 )
             
+            # Incident documents are decoded on every request; the pure-Python codec is much slower
+            if not bson.has_c():
+                logger.warning("⚠️ bson C extension not available - BSON encoding/decoding will be slow")
+            
             # Test connection
             self.client.admin.command('ping')
             
@@ -54,31 +86,82 @@ class MongoDBClient:
             self.db = self.client[settings.MONGO_DB]
             self.incidents_collection = self.db[settings.INCIDENT_COLLECTION]
             self.sessions_collection = self.db[settings.SESSION_COLLECTION]
+            self.counters_collection = self.db["counters"]
+            self.embedding_cache_collection = self.db["embedding_cache"]
+            self.pending_kb_collection = self.db["pending_kb_entries"]
             
             # Create indexes
             self._create_indexes()
+            self._backfill_incident_types()
             
             logger.info(f"✅ Connected to MongoDB database: {settings.MONGO_DB}")
+            logger.info(f"   Topology: {self.client.topology_description}")
             
         except Exception as e:
             logger.error(f"❌ Failed to connect to MongoDB: {e}")
+            # Let a later connect() retry with a fresh client
+            if self.client is not None:
+                self.client.close()
+                self.client = None
             raise
     
+    def _pool_options(self) -> Dict[str, Any]:
+        """Connection pool settings shared by every environment"""
+        return {
+            'maxPoolSize': settings.MONGO_MAX_POOL_SIZE,
+            'minPoolSize': settings.MONGO_MIN_POOL_SIZE,
+            'maxIdleTimeMS': settings.MONGO_MAX_IDLE_TIME_MS,
+            'waitQueueTimeoutMS': 2000,
+            'appname': 'ims'
+        }
+    
     def _create_indexes(self):
         """Create necessary indexes"""
         try:
             self.incidents_collection.create_index([("incident_id", ASCENDING)], unique=True)
-            self.incidents_collection.create_index([("status", ASCENDING)])
-            self.incidents_collection.create_index([("session_id", ASCENDING)])
+            # Status lists and the admin dashboard sort newest first
+            self.incidents_collection.create_index([("status", ASCENDING), ("created_on", DESCENDING)])
+            self.incidents_collection.create_index([("created_on", DESCENDING)])
+            # Per-session lookups of pending incidents
+            self.incidents_collection.create_index([("session_id", ASCENDING), ("status", ASCENDING)])
+            # Only the few incidents awaiting KB approval are indexed; one partial index per
+            # flag lets the approval queue's $or be answered as an index union
+            for flag in ("needs_kb_approval", "requires_kb_addition", "is_new_kb_entry"):
+                self.incidents_collection.create_index(
+                    [(flag, ASCENDING)],
+                    partialFilterExpression={flag: True}
+                )
+            # Admin filters combine status with the KB approval flag
+            self.incidents_collection.create_index([("status", ASCENDING), ("needs_kb_approval", ASCENDING)])
+            # Incidents linked to a KB entry; most pending ones have none
+            self.incidents_collection.create_index([("kb_id", ASCENDING)], sparse=True)
             self.sessions_collection.create_index([("session_id", ASCENDING)], unique=True)
             logger.info("✅ Database indexes created successfully")
         except Exception as e:
             logger.error(f"❌ Error creating indexes: {e}")
     
+    def _backfill_incident_types(self):
+        """Store incident_type on incidents created before it was written at creation time"""
+        try:
+            demand = {"$ifNull": ["$user_demand", "IT Issue"]}
+            result = self.incidents_collection.update_many(
+                {"incident_type": {"$exists": False}},
+                [{"$set": {"incident_type": {"$cond": [
+                    {"$gt": [{"$strLenCP": demand}, 50]},
+                    {"$concat": [{"$substrCP": [demand, 0, 50]}, "..."]},
+                    demand
+                ]}}}]
+            )
+            if result.modified_count:
+                logger.info(f"✅ Backfilled incident_type on {result.modified_count} incidents")
+        except Exception as e:
+            logger.error(f"❌ Error backfilling incident types: {e}")
+    
     def disconnect(self):
         """Disconnect from MongoDB"""
         if self.client:
             self.client.close()
+            self.client = None
             logger.info("🔌 Disconnected from MongoDB")
     
     # Incident Operations
@@ -91,17 +174,62 @@ class MongoDBClient:
             logger.error(f"Error creating incident: {e}")
             return False
     
-    def get_incident_by_id(self, incident_id: str) -> Optional[Dict[str, Any]]:
-        """Get incident by ID"""
+    def get_incident_by_id(self, incident_id: str,
+                           projection: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+        """Get incident by ID; projected reads skip the cache, which only holds full documents"""
         try:
+            if projection is not None:
+                incident = self.incidents_collection.find_one({"incident_id": incident_id}, projection)
+                if incident and '_id' in incident:
+                    incident['_id'] = str(incident['_id'])
+                return incident
+            
+            with self._incident_cache_lock:
+                cached = self._incident_cache.get(incident_id)
+                if cached is not None:
+                    expires_at, incident = cached
+                    if expires_at > time.monotonic():
+                        self._incident_cache.move_to_end(incident_id)
+                        return copy.deepcopy(incident)
+                    del self._incident_cache[incident_id]
+            
             incident = self.incidents_collection.find_one({"incident_id": incident_id})
             if incident and '_id' in incident:
                 incident['_id'] = str(incident['_id'])
+            if incident:
+                with self._incident_cache_lock:
+                    self._incident_cache[incident_id] = (
+                        time.monotonic() + INCIDENT_CACHE_TTL, copy.deepcopy(incident)
+                    )
+                    if len(self._incident_cache) > INCIDENT_CACHE_SIZE:
+                        self._incident_cache.popitem(last=False)
             return incident
         except Exception as e:
             logger.error(f"Error getting incident: {e}")
             return None
     
+    def invalidate_incident(self, incident_id: Optional[str] = None):
+        """Drop one incident (or all incidents) from the lookup cache after a write"""
+        with self._incident_cache_lock:
+            if incident_id is None:
+                self._incident_cache.clear()
+            else:
+                self._incident_cache.pop(incident_id, None)
+    
+    def get_incident_summary(self, incident_id: str) -> Optional[Dict[str, Any]]:
+        """Get incident by ID without its conversation history and solution steps"""
+        try:
+            incident = self.incidents_collection.find_one(
+                {"incident_id": incident_id},
+                {"conversation_history": 0, "solution_steps": 0}
+            )
+            if incident and '_id' in incident:
+                incident['_id'] = str(incident['_id'])
+            return incident
+        except Exception as e:
+            logger.error(f"Error getting incident summary: {e}")
+            return None
+    
     def update_incident(self, incident_id: str, update_data: Dict[str, Any]) -> bool:
         """Update an incident"""
         try:
@@ -110,15 +238,80 @@ class MongoDBClient:
                 {"incident_id": incident_id},
                 {"$set": update_data}
             )
+            self.invalidate_incident(incident_id)
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Error updating incident: {e}")
             return False
     
-    def get_all_incidents(self) -> List[Dict[str, Any]]:
+    def close_incident_atomic(self, incident_id: str) -> Optional[Dict[str, Any]]:
+        """Close an incident and return its summary fields in one round-trip; None if it doesn't exist"""
+        try:
+            now = datetime.utcnow()
+            incident = self.incidents_collection.find_one_and_update(
+                {"incident_id": incident_id},
+                {"$set": {"status": "closed", "closed_on": now, "updated_on": now}},
+                projection={"_id": 0, "incident_id": 1, "user_demand": 1, "session_id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            self.invalidate_incident(incident_id)
+            return incident
+        except Exception as e:
+            logger.error(f"Error closing incident: {e}")
+            return None
+    
+    def delete_incidents_and_clear_session(self, session_id: str, incident_ids: List[str]) -> int:
+        """Delete a session's incidents and reset the session; returns the deleted count"""
+        deleted_count = 0
+        try:
+            if incident_ids:
+                result = self.incidents_collection.delete_many({"incident_id": {"$in": incident_ids}})
+                deleted_count = result.deleted_count
+                for incident_id in incident_ids:
+                    self.invalidate_incident(incident_id)
+            
+            self.sessions_collection.update_one(
+                {"session_id": session_id},
+                {"$set": {
+                    "conversation_context": [],
+                    "active_incidents": [],
+                    "pending_new_incident_query": None,
+                    "awaiting_response": None,
+                    "updated_on": datetime.utcnow()
+                }}
+            )
+            self.invalidate_session(session_id)
+        except Exception as e:
+            logger.error(f"Error deleting incidents and clearing session: {e}")
+        return deleted_count
+    
+    def append_incident_conversation(self, incident_id: str, messages: List[Dict[str, str]],
+                                     set_fields: Optional[Dict[str, Any]] = None,
+                                     inc_fields: Optional[Dict[str, int]] = None) -> bool:
+        """Atomically append messages to an incident's conversation history"""
+        try:
+            update_data = dict(set_fields or {})
+            update_data['updated_on'] = datetime.utcnow()
+            update = {
+                "$push": {"conversation_history": {"$each": messages}},
+                "$set": update_data
+            }
+            if inc_fields:
+                update["$inc"] = inc_fields
+            result = self.incidents_collection.update_one(
+                {"incident_id": incident_id},
+                update
+            )
+            self.invalidate_incident(incident_id)
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error appending incident conversation: {e}")
+            return False
+    
+    def get_all_incidents(self, projection: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
         """Get all incidents sorted by creation date (newest first)"""
         try:
-            incidents = list(self.incidents_collection.find({}).sort("created_on", -1))
+            incidents = list(self.incidents_collection.find({}, projection).sort("created_on", -1))
             for incident in incidents:
                 if '_id' in incident:
                     incident['_id'] = str(incident['_id'])
@@ -139,10 +332,11 @@ class MongoDBClient:
             logger.error(f"Error getting incidents by status: {e}")
             return []
     
-    def get_incidents_by_filter(self, filter_dict: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def get_incidents_by_filter(self, filter_dict: Dict[str, Any],
+                                projection: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
         """Get incidents by filter sorted by creation date (newest first)"""
         try:
-            incidents = list(self.incidents_collection.find(filter_dict).sort("created_on", -1))
+            incidents = list(self.incidents_collection.find(filter_dict, projection).sort("created_on", -1))
             for incident in incidents:
                 if '_id' in incident:
                     incident['_id'] = str(incident['_id'])
@@ -151,6 +345,18 @@ class MongoDBClient:
             logger.error(f"Error getting incidents: {e}")
             return []
     
+    def aggregate_incidents(self, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run an aggregation pipeline over the incidents collection"""
+        try:
+            incidents = list(self.incidents_collection.aggregate(pipeline))
+            for incident in incidents:
+                if '_id' in incident:
+                    incident['_id'] = str(incident['_id'])
+            return incidents
+        except Exception as e:
+            logger.error(f"Error aggregating incidents: {e}")
+            return []
+    
     def get_incidents_by_session(self, session_id: str) -> List[Dict[str, Any]]:
         """Get incidents by session ID"""
         try:
@@ -173,17 +379,130 @@ class MongoDBClient:
             logger.error(f"Error creating session: {e}")
             return False
     
-    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Get session by ID"""
+    def get_session(self, session_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Get session by ID, optionally limited to the projected fields"""
         try:
-            session = self.sessions_collection.find_one({"session_id": session_id})
+            projection_key = repr(projection)
+            with self._session_cache_lock:
+                cached = self._session_cache.get(session_id)
+                if cached is not None:
+                    expires_at, views = cached
+                    if expires_at <= time.monotonic():
+                        del self._session_cache[session_id]
+                    elif projection_key in views:
+                        self._session_cache.move_to_end(session_id)
+                        return copy.deepcopy(views[projection_key])
+            
+            session = self.sessions_collection.find_one({"session_id": session_id}, projection)
             if session and '_id' in session:
                 session['_id'] = str(session['_id'])
+            if session:
+                with self._session_cache_lock:
+                    cached = self._session_cache.get(session_id)
+                    if cached is None:
+                        cached = self._session_cache[session_id] = (time.monotonic() + SESSION_CACHE_TTL, {})
+                        if len(self._session_cache) > SESSION_CACHE_SIZE:
+                            self._session_cache.popitem(last=False)
+                    cached[1][projection_key] = copy.deepcopy(session)
             return session
         except Exception as e:
             logger.error(f"Error getting session: {e}")
             return None
     
+    def invalidate_session(self, session_id: Optional[str] = None):
+        """Drop one session (or all sessions) from the read cache after a write"""
+        with self._session_cache_lock:
+            if session_id is None:
+                self._session_cache.clear()
+            else:
+                self._session_cache.pop(session_id, None)
+    
+    def seed_counter(self, name: str, value: int) -> bool:
+        """Raise a named counter to at least value (no-op if it is already higher)"""
+        try:
+            self.counters_collection.update_one({"_id": name}, {"$max": {"seq": value}}, upsert=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error seeding counter {name}: {e}")
+            return False
+    
+    def next_sequence(self, name: str) -> Optional[int]:
+        """Atomically increment a named counter and return the new value"""
+        try:
+            counter = self.counters_collection.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"seq": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return counter["seq"]
+        except Exception as e:
+            logger.error(f"Error incrementing counter {name}: {e}")
+            return None
+    
+    def get_cached_embeddings(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up stored embeddings by content hash in one query, as float16 arrays"""
+        if not keys:
+            return {}
+        try:
+            return {
+                # Older entries hold a plain list of doubles
+                doc["_id"]: (np.frombuffer(doc["vector"], dtype=np.float16) if isinstance(doc["vector"], bytes)
+                             else np.asarray(doc["vector"], dtype=np.float16))
+                for doc in self.embedding_cache_collection.find({"_id": {"$in": keys}}, {"vector": 1})
+            }
+        except Exception as e:
+            logger.error(f"Error reading cached embeddings: {e}")
+            return {}
+    
+    def store_embeddings(self, vectors: Dict[str, Any]) -> bool:
+        """Persist embeddings under their content hashes in one bulk write, packed as float16 bytes"""
+        if not vectors:
+            return True
+        try:
+            now = datetime.utcnow()
+            self.embedding_cache_collection.bulk_write([
+                UpdateOne({"_id": key}, {"$setOnInsert": {
+                    "vector": bson.Binary(np.asarray(vector, dtype=np.float16).tobytes()),
+                    "created_on": now
+                }}, upsert=True)
+                for key, vector in vectors.items()
+            ], ordered=False)
+            return True
+        except Exception as e:
+            logger.error(f"Error storing embeddings: {e}")
+            return False
+    
+    def add_pending_kb_entry(self, entry: Dict[str, Any]) -> bool:
+        """Record a KB entry that still has to be embedded and indexed"""
+        try:
+            self.pending_kb_collection.replace_one({"_id": entry["kb_id"]}, {"_id": entry["kb_id"], **entry}, upsert=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error recording pending KB entry: {e}")
+            return False
+    
+    def remove_pending_kb_entry(self, kb_id: str) -> bool:
+        try:
+            self.pending_kb_collection.delete_one({"_id": kb_id})
+            return True
+        except Exception as e:
+            logger.error(f"Error removing pending KB entry: {e}")
+            return False
+    
+    def get_pending_kb_entries(self) -> List[Dict[str, Any]]:
+        try:
+            return list(self.pending_kb_collection.find({}, {"_id": 0}))
+        except Exception as e:
+            logger.error(f"Error reading pending KB entries: {e}")
+            return []
+    
+    def get_session_meta(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session's routing fields without its conversation context"""
+        return self.get_session(session_id, {
+            "_id": 0, "session_id": 1, "active_incidents": 1, "awaiting_response": 1, "updated_on": 1
+        })
+    
     def update_session(self, session_id: str, update_data: Dict[str, Any]) -> bool:
         """Update a session"""
         try:
@@ -192,10 +511,90 @@ class MongoDBClient:
                 {"session_id": session_id},
                 {"$set": update_data}
             )
+            self.invalidate_session(session_id)
             return result.modified_count > 0
         except Exception as e:
             logger.error(f"Error updating session: {e}")
             return False
+    
+    def _conversation_push(self, messages: List[Dict[str, str]], max_messages: int) -> Dict[str, Any]:
+        """Update document that appends messages and trims the context server-side"""
+        return {
+            "$push": {"conversation_context": {"$each": messages, "$slice": -max_messages}},
+            "$set": {"updated_on": datetime.utcnow()}
+        }
+    
+    def append_conversation(self, session_id: str, messages: List[Dict[str, str]],
+                            max_messages: int = 10) -> bool:
+        """Atomically append messages to a session's conversation context"""
+        try:
+            result = self.sessions_collection.update_one(
+                {"session_id": session_id},
+                self._conversation_push(messages, max_messages)
+            )
+            self.invalidate_session(session_id)
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error appending session conversation: {e}")
+            return False
+    
+    def append_conversations(self, pending: Dict[str, List[Dict[str, str]]],
+                             max_messages: int = 10) -> int:
+        """Append messages to several sessions' conversation context in one bulk write"""
+        modified = self.bulk_update_sessions([
+            UpdateOne({"session_id": session_id}, self._conversation_push(messages, max_messages))
+            for session_id, messages in pending.items()
+        ], invalidate=False)
+        for session_id in pending:
+            self.invalidate_session(session_id)
+        return modified
+    
+    def bulk_update_sessions(self, ops: List[UpdateOne], invalidate: bool = True) -> int:
+        """Apply several session updates in one bulk write; returns the modified count"""
+        if not ops:
+            return 0
+        try:
+            result = self.sessions_collection.bulk_write(ops, ordered=False)
+            if invalidate:
+                # Ops are opaque here, so drop every cached session
+                self.invalidate_session()
+            return result.modified_count
+        except Exception as e:
+            logger.error(f"Error bulk updating sessions: {e}")
+            return 0
+    
+    def add_active_incident(self, session_id: str, incident_id: str) -> bool:
+        """Add an incident to a session's active incidents without reading the session"""
+        try:
+            result = self.sessions_collection.update_one(
+                {"session_id": session_id},
+                {
+                    "$addToSet": {"active_incidents": incident_id},
+                    "$set": {"updated_on": datetime.utcnow()}
+                },
+                upsert=True
+            )
+            self.invalidate_session(session_id)
+            return result.modified_count > 0 or result.upserted_id is not None
+        except Exception as e:
+            logger.error(f"Error adding incident to session: {e}")
+            return False
+    
+    def remove_active_incident(self, session_id: str, incident_id: str) -> bool:
+        """Remove an incident from a session's active incidents without reading the session"""
+        try:
+            result = self.sessions_collection.update_one(
+                {"session_id": session_id},
+                {
+                    "$pull": {"active_incidents": incident_id},
+                    "$set": {"updated_on": datetime.utcnow()}
+                }
+            )
+            self.invalidate_session(session_id)
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error removing incident from session: {e}")
+            return False
 
 
 # Global MongoDB client instance
@@ -11,7 +11,8 @@ import psutil
 from core.config import settings
 from db.mongo import mongo_client
 from db.chroma import chroma_client
-from services.kb_service import kb_service
+from services.kb_service import kb_service, kb_writer
+from services.session_buffer import session_buffer, session_writer
 from services.embedding_wrapper import embedding_service  # ✅ IMPORT embedding_service
 from api import chat, admin
 from api.incidents import router as incident_router
@@ -29,7 +30,7 @@ logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(__file__)
 STATIC_DIR = os.path.join(BASE_DIR, "static")
-KB_FILE = os.path.join(BASE_DIR, "knowledge_base", "docs", "kb_data.txt")
+KB_FILE = settings.KB_FILE_PATH
 
 
 @asynccontextmanager
@@ -67,6 +68,8 @@ async def lifespan(app: FastAPI):
                 else:
                     logger.error("❌ Failed to initialize knowledge base")
             else:
+                kb_service.migrate_list_metadata(existing_entries)
+                kb_service.load_vocabulary()
                 logger.info(f"ℹ️  KB already initialized with {len(existing_entries)} entries:")
                 for entry in existing_entries[:3]:  # Show first 3 entries
                     logger.info(f"   - {entry.get('id')}: {entry.get('metadata', {}).get('use_case', 'N/A')[:50]}")
@@ -78,6 +81,9 @@ async def lifespan(app: FastAPI):
             if os.path.exists(kb_docs_dir):
                 logger.warning(f"    {os.listdir(kb_docs_dir)}")
         
+        # Approved KB entries whose background indexing didn't finish before the last shutdown
+        kb_service.resume_pending_kb_entries()
+        
         # ✅ FIX: Test embedding service correctly
         logger.info("🧪 Testing embedding service...")
         test_embedding = embedding_service.generate_embedding("test query")  # ✅ Use imported service
@@ -98,6 +104,11 @@ async def lifespan(app: FastAPI):
     
     # Shutdown logic
     logger.info("🛑 Shutting down application...")
+    kb_service.shutdown_indexer()
+    kb_writer.flush(timeout=5)
+    kb_service.close_kb_file()
+    session_writer.shutdown()
+    session_buffer.flush_all()
     mongo_client.disconnect()
     logger.info("✅ Application shutdown complete")
 
@@ -1,11 +1,15 @@
 from .incident_service import incident_service
-from .kb_service import kb_service
+from .kb_service import kb_service, kb_writer
 from .llm_service import llm_service
 from .embedding_wrapper import embedding_service
+from .session_buffer import session_buffer, session_writer
 
 __all__ = [
     "incident_service",
     "kb_service", 
+    "kb_writer",
     "llm_service",
-    "embedding_service"
+    "embedding_service",
+    "session_buffer",
+    "session_writer"
 ]
\ No newline at end of file
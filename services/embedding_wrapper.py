@@ -19,11 +19,18 @@ class EmbeddingService:
 
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using Jina AI API with retries"""
+        embeddings = self.generate_embeddings_batch([text])
+        return embeddings[0] if embeddings else []
+    
+    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed several texts in one Jina API request; returns [] on failure, else one vector per text"""
+        if not texts:
+            return []
         max_retries = 3
         
         for attempt in range(max_retries):
             try:
-                logger.info(f"🔄 Attempt {attempt + 1}/{max_retries}: Generating embedding for: '{text[:50]}...'")
+                logger.info(f"🔄 Attempt {attempt + 1}/{max_retries}: Generating {len(texts)} embedding(s) for: '{texts[0][:50]}...'")
                 
                 response = requests.post(
                     self.api_url,
@@ -33,7 +40,7 @@ class EmbeddingService:
                     },
                     json={
                         "model": self.model,
-                        "input": [text]
+                        "input": texts
                     },
                     timeout=30
                 )
@@ -41,11 +48,13 @@ class EmbeddingService:
                 response.raise_for_status()
                 data = response.json()
                 
-                # Extract embedding from response
-                if 'data' in data and len(data['data']) > 0 and 'embedding' in data['data'][0]:
-                    embedding = data['data'][0]['embedding']
-                    logger.info(f"✅ Generated embedding successfully (dim: {len(embedding)})")
-                    return embedding
+                # Extract embeddings from response, in input order
+                items = data.get('data') if isinstance(data, dict) else None
+                if items and len(items) == len(texts) and all('embedding' in item for item in items):
+                    items = sorted(items, key=lambda item: item.get('index', 0))
+                    embeddings = [item['embedding'] for item in items]
+                    logger.info(f"✅ Generated {len(embeddings)} embedding(s) successfully (dim: {len(embeddings[0])})")
+                    return embeddings
                 else:
                     logger.error(f"❌ Invalid response format: {data}")
                     if attempt < max_retries - 1:
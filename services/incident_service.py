@@ -1,26 +1,131 @@
 # backend/services/incident_service.py - COMPLETE CORRECTED VERSION
 from db.mongo import mongo_client
-from services.kb_service import kb_service
-from services.llm_service import llm_service
+from services.kb_service import kb_service, kb_writer
+from services.llm_service import llm_service, LLM_FALLBACK_RESPONSE
+from services.session_buffer import session_buffer, session_writer
+from services.semantic_cache import semantic_cache
 from utils.preprocessing import generate_incident_id
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 from datetime import datetime
+from collections import deque
+from types import MappingProxyType
+import hashlib
+import json
 import logging
 import uuid
 import re
 
 logger = logging.getLogger(__name__)
 
+_INC_ID_RE = re.compile(r'INC\d+')
+
+# Phrases that mean the user is asking about an earlier incident, matched in one pass
+_PREV_SOL_KEYWORDS = (
+    'previous', 'last', 'earlier', 'before', 'my incident', 'solution',
+    'what happened', 'status', 'view solution', 'continue my', 'old incident'
+)
+_PREV_SOL_RE = re.compile('|'.join(map(re.escape, _PREV_SOL_KEYWORDS)), re.IGNORECASE)
+
+# Heavy per-incident fields that the admin list views never display
+LIST_VIEW_PROJECTION = {
+    'conversation_history': 0, 'solution_steps': 0, 'questions': 0, 'collected_info': 0,
+    'missing_info': 0, 'required_info': 0, 'last_assistant_question': 0
+}
+
+# Fields the dashboard counts are computed from
+STATS_PROJECTION = {'_id': 0, 'status': 1, 'needs_kb_approval': 1}
+
+# Session fields a chat turn reads; history is trimmed server-side to what the LLM sees
+SESSION_TURN_PROJECTION = {
+    '_id': 0, 'session_id': 1, 'active_incidents': 1, 'awaiting_response': 1,
+    'pending_new_incident_query': 1, 'conversation_context': {'$slice': -10}
+}
+
+# Fields needed to describe an incident's status back to the user
+STATUS_VIEW_PROJECTION = {
+    '_id': 0, 'incident_id': 1, 'status': 1, 'user_demand': 1,
+    'collected_info': 1, 'solution_steps': 1, 'admin_message': 1
+}
+
+# Fields read when an admin approves an incident's solution for the KB
+KB_APPROVAL_PROJECTION = {
+    '_id': 0, 'is_new_kb_entry': 1, 'user_demand': 1, 'required_info': 1, 'questions': 1
+}
+
+# Fixed part of the incident update written when a KB entry is approved
+KB_APPROVAL_UPDATE_TEMPLATE = {'needs_kb_approval': False, 'requires_kb_addition': False}
+
+# Default admin message shown to the user for each incident status
+DEFAULT_ADMIN_MESSAGES = MappingProxyType({
+    'pending_info': 'Still need some information.',
+    'open': 'All information collected. Our team will contact you soon.',
+    'resolved': 'Incident has been resolved successfully.',
+    'closed': 'Incident has been closed.'
+})
+
+# Admin messages that were never customised and may be replaced on status change
+_STALE_ADMIN_MESSAGES = frozenset(DEFAULT_ADMIN_MESSAGES.values())
+
+# Display defaults for legacy incidents, filled in server-side instead of per-document in Python
+LIST_VIEW_DEFAULTS = {
+    # Stored at creation and backfilled on connect; the fallback only covers a failed backfill
+    'incident_type': {'$ifNull': ['$incident_type', {'$ifNull': ['$user_demand', 'IT Issue']}]},
+    'use_case': {'$ifNull': ['$use_case', {'$ifNull': ['$user_demand', 'Unknown Issue']}]},
+    'needs_kb_approval': {'$ifNull': ['$needs_kb_approval', False]},
+    'is_new_kb_entry': {'$ifNull': ['$is_new_kb_entry', False]},
+    'admin_message': {'$ifNull': ['$admin_message', '']}
+}
+
+
+def _incident_type_label(user_demand: str) -> str:
+    """Short display label stored on an incident when it is created"""
+    user_demand = user_demand or 'IT Issue'
+    return user_demand[:50] + '...' if len(user_demand) > 50 else user_demand
+
+
+def _list_view_pipeline(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Build the aggregation used by the admin incident list views"""
+    return [
+        {'$match': match},
+        {'$sort': {'created_on': -1}},
+        {'$project': LIST_VIEW_PROJECTION},
+        {'$addFields': LIST_VIEW_DEFAULTS}
+    ]
+
+
 class IncidentService:
     
     def __init__(self):
-        pass
+        # Previous-solution handlers by incident status; anything else shows the details
+        self._prev_sol_handlers = {
+            'pending_info': self._resume_pending_incident
+        }
+        # Detected intent -> handler(user_input, session_id, conversation_history, active_incidents, intent_data);
+        # anything unlisted is answered as a general query
+        self._intent_handlers = {
+            'GREETING': lambda q, sid, hist, active, data: self._handle_greeting(q, sid, hist),
+            'GREETING_CONTEXT': lambda q, sid, hist, active, data: self._handle_greeting_context(q, sid, hist, active),
+            'UNRELATED_QUERY': lambda q, sid, hist, active, data: self._handle_unrelated_query(q, sid, hist, active),
+            'CLEAR_SESSION': lambda q, sid, hist, active, data: self._handle_clear_session(sid, hist, q),
+            'TRACK_INCIDENT': lambda q, sid, hist, active, data: self._handle_track_incident_request(q, sid, hist),
+            'ASK_INCIDENT_TYPE': lambda q, sid, hist, active, data: self._handle_ask_incident_type(q, sid, hist),
+            'ASK_INCOMPLETE_INCIDENT': lambda q, sid, hist, active, data: self._handle_ask_incomplete_incident(q, sid, hist),
+            'PROVIDE_INCIDENT_ID': lambda q, sid, hist, active, data: self._handle_track_incident_by_id(
+                data.get('extracted_incident_id'), q, sid, hist),
+            'CLOSE_INCIDENT': lambda q, sid, hist, active, data: self._handle_close_incident(active, q, sid, hist),
+            'ASK_PREVIOUS_SOLUTION': lambda q, sid, hist, active, data: self._handle_ask_previous_solution(q, sid, hist),
+            'NEW_INCIDENT': self._route_new_incident,
+            'CONTINUE_INCIDENT': self._route_continue_incident,
+        }
     
     def create_session(self) -> str:
         """Create a new session"""
-        session_id = str(uuid.uuid4())
+        return self._create_session_doc()['session_id']
+    
+    def _create_session_doc(self) -> Dict[str, Any]:
+        """Create a new session and return its document"""
         session_data = {
-            'session_id': session_id,
+            'session_id': str(uuid.uuid4()),
             'active_incidents': [],
             'conversation_context': [],
             'awaiting_response': None,
@@ -28,12 +133,12 @@ class IncidentService:
             'updated_on': datetime.utcnow()
         }
         mongo_client.create_session(session_data)
-        return session_id
+        return session_data
     
     def get_or_create_session(self, session_id: Optional[str]) -> str:
         """Get existing session or create new one"""
         if session_id:
-            session = mongo_client.get_session(session_id)
+            session = mongo_client.get_session_meta(session_id)
             if session:
                 return session_id
         
@@ -42,6 +147,9 @@ class IncidentService:
     def clear_session(self, session_id: str) -> bool:
         """Clear session history and start fresh"""
         try:
+            session_writer.wait(session_id)
+            session_buffer.discard(session_id)
+            semantic_cache.invalidate(session_id)
             mongo_client.update_session(session_id, {
                 'conversation_context': [],
                 'active_incidents': [],
@@ -56,43 +164,38 @@ class IncidentService:
    
     def update_session_context(self, session_id: str, user_input: str, assistant_response: str):
         """Update session conversation context - keep only last 10 messages"""
-        session = mongo_client.get_session(session_id)
-        if session:
-            conversation_context = session.get('conversation_context', [])
-            conversation_context.append({'role': 'user', 'content': user_input})
-            conversation_context.append({'role': 'assistant', 'content': assistant_response})
-            
-            if len(conversation_context) > 10:
-                conversation_context = conversation_context[-10:]
-            
-            mongo_client.update_session(session_id, {
-                'conversation_context': conversation_context
-            })
+        # Buffered and written in bulk; flushed before the session is next read
+        session_buffer.append(session_id, [
+            {'role': 'user', 'content': user_input},
+            {'role': 'assistant', 'content': assistant_response}
+        ])
 
+    def _build_llm_history(self, session: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Canonical conversation history handed to every LLM call for this turn"""
+        # Same stored messages -> byte-identical prompt text, so provider prompt caches keep hitting
+        history = [
+            {'role': msg.get('role', ''), 'content': msg.get('content', '')}
+            for msg in session.get('conversation_context', [])[-10:]
+        ]
+        if logger.isEnabledFor(logging.DEBUG):
+            digest = hashlib.sha1(
+                json.dumps(history, sort_keys=True, ensure_ascii=False).encode('utf-8')
+            ).hexdigest()[:12]
+            logger.debug(f"LLM history for {session.get('session_id')}: {len(history)} messages, hash {digest}")
+        return history
+    
     def add_incident_to_session(self, session_id: str, incident_id: str):
         """Add incident to session's active incidents"""
-        session = mongo_client.get_session(session_id)
-        if session:
-            active_incidents = session.get('active_incidents', [])
-            if incident_id not in active_incidents:
-                active_incidents.append(incident_id)
-                mongo_client.update_session(session_id, {
-                    'active_incidents': active_incidents
-                })
+        session_writer.submit(session_id, mongo_client.add_active_incident, session_id, incident_id)
     
     def remove_incident_from_session(self, session_id: str, incident_id: str):
         """Remove incident from session's active incidents"""
-        session = mongo_client.get_session(session_id)
-        if session:
-            active_incidents = session.get('active_incidents', [])
-            if incident_id in active_incidents:
-                active_incidents.remove(incident_id)
-                mongo_client.update_session(session_id, {
-                    'active_incidents': active_incidents
-                })
+        session_writer.submit(session_id, mongo_client.remove_active_incident, session_id, incident_id)
     
     def get_session_history(self, session_id: str) -> List[Dict[str, str]]:
         """Get session conversation history"""
+        session_writer.wait(session_id)
+        session_buffer.flush(session_id)
         session = mongo_client.get_session(session_id)
         if session:
             return session.get('conversation_context', [])
@@ -102,22 +205,25 @@ class IncidentService:
 
     # In the process_user_query method, make sure ALL code paths return a dictionary
 
-    def process_user_query(self, user_input: str, session_id: str) -> Dict[str, Any]:
-        """Main method to process user query with intent detection"""
+    def process_user_query(self, user_input: str, session_id: str,
+                           on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Main method to process user query with intent detection; on_token receives streamed reply text"""
         try:
-            session_id = self.get_or_create_session(session_id)
-            session = mongo_client.get_session(session_id)
+            # One session read per turn; handlers get the document passed down
+            session = None
+            if session_id:
+                session_writer.wait(session_id)
+                session_buffer.flush(session_id)
+                session = mongo_client.get_session(session_id, SESSION_TURN_PROJECTION)
+            if not session:
+                session = self._create_session_doc()
+                session_id = session['session_id']
             
             if not session:
                 logger.error(f"Failed to get or create session: {session_id}")
                 return self._create_error_response(session_id, "Failed to create session")
             
-            conversation_history = session.get('conversation_context', [])
-            if len(conversation_history) > 10:
-                conversation_history = conversation_history[-10:]
-                mongo_client.update_session(session_id, {
-                    'conversation_context': conversation_history
-                })
+            conversation_history = self._build_llm_history(session)
             
             active_incidents = session.get('active_incidents', [])
             awaiting_response = session.get('awaiting_response')
@@ -153,7 +259,7 @@ class IncidentService:
             
             # Handle keep/ignore response FIRST
             if awaiting_response == 'keep_or_ignore':
-                return self._handle_keep_ignore_response(user_input, session_id, conversation_history, active_incidents)
+                return self._handle_keep_ignore_response(user_input, session_id, conversation_history, active_incidents, session)
             
             # Handle other awaiting responses
             if awaiting_response == 'issue_description':
@@ -198,7 +304,7 @@ class IncidentService:
                     
                     if not_command:
                         logger.info(f"🎯 Short answer with active incident → CONTINUE_INCIDENT: '{user_input}'")
-                        pending_incidents = self._get_pending_incidents(active_incidents)
+                        pending_incidents = self._get_pending_incidents(active_incidents, session_id)
                         if pending_incidents:
                             return self._continue_incident(pending_incidents[-1], user_input, session_id, conversation_history)
             
@@ -218,66 +324,13 @@ class IncidentService:
             intent = intent_data.get('intent', 'GENERAL_QUERY')
             logger.info(f"Processing intent: {intent}")
             
-            # Handle different intents - ensure ALL return a value
-            if intent == 'GREETING':
-                return self._handle_greeting(user_input, session_id, conversation_history)
-            
-            elif intent == 'GREETING_CONTEXT':
-                return self._handle_greeting_context(user_input, session_id, conversation_history, active_incidents)
-            
-            elif intent == 'UNRELATED_QUERY':
-                return self._handle_unrelated_query(user_input, session_id, conversation_history, active_incidents)
-            
-            elif intent == 'CLEAR_SESSION':
-                return self._handle_clear_session(session_id, conversation_history, user_input)
-            
-            elif intent == 'TRACK_INCIDENT':
-                return self._handle_track_incident_request(user_input, session_id, conversation_history)
-            
-            elif intent == 'ASK_INCIDENT_TYPE':
-                return self._handle_ask_incident_type(user_input, session_id, conversation_history)
-            
-            elif intent == 'ASK_INCOMPLETE_INCIDENT':
-                return self._handle_ask_incomplete_incident(user_input, session_id, conversation_history)
-            
-            elif intent == 'PROVIDE_INCIDENT_ID':
-                incident_id = intent_data.get('extracted_incident_id')
-                return self._handle_track_incident_by_id(incident_id, user_input, session_id, conversation_history)
-            
-            elif intent == 'CLOSE_INCIDENT':
-                return self._handle_close_incident(active_incidents, user_input, session_id, conversation_history)
-            
-            elif intent == 'ASK_PREVIOUS_SOLUTION':
-                return self._handle_ask_previous_solution(user_input, session_id, conversation_history)
-            
-            elif intent == 'NEW_INCIDENT':
-                if has_active_incident:
-                    return self._handle_new_incident_with_active(user_input, session_id, conversation_history, active_incidents)
-                else:
-                    return self._handle_new_incident(user_input, session_id, conversation_history)
-            
-            elif intent == 'CONTINUE_INCIDENT':
-                pending_incidents = self._get_pending_incidents(active_incidents)
-                if pending_incidents:
-                    return self._continue_incident(pending_incidents[-1], user_input, session_id, conversation_history)
-                else:
-                    return self._handle_new_incident(user_input, session_id, conversation_history)
-            
-            else:
-                # ✅ FIX: Ensure this always returns a value
-                response = llm_service.handle_general_query(user_input, conversation_history)
-                self.update_session_context(session_id, user_input, response)
-                return {
-                    'message': response,
-                    'session_id': session_id,
-                    'incident_id': None,
-                    'status': None
-                }
+            handler = self._intent_handlers.get(intent)
+            if handler is None:
+                return self._handle_general_intent(user_input, session_id, conversation_history, on_token)
+            return handler(user_input, session_id, conversation_history, active_incidents, intent_data)
             
         except Exception as e:
-            logger.error(f"Error processing user query: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"Error processing user query: {e}")
             # ✅ FIX: Always return a proper error response
             return self._create_error_response(session_id, str(e))
 
@@ -302,8 +355,8 @@ class IncidentService:
             return {"intent": "TRACK_INCIDENT", "confidence": 0.8}
         elif any(word in user_lower for word in ['create', 'new incident', 'report']):
             return {"intent": "NEW_INCIDENT", "confidence": 0.8}
-        elif re.search(r'INC\d+', user_input):
-            incident_id = re.search(r'INC\d+', user_input).group()
+        elif _INC_ID_RE.search(user_input):
+            incident_id = _INC_ID_RE.search(user_input).group()
             return {"intent": "PROVIDE_INCIDENT_ID", "confidence": 0.9, "extracted_incident_id": incident_id}
         else:
             return {"intent": "CONTINUE_INCIDENT" if has_active_incident else "NEW_INCIDENT", "confidence": 0.6}
@@ -368,6 +421,40 @@ class IncidentService:
         
         return has_issue_keywords and is_not_answer and is_different_issue
     # ✅ ADD NEW METHOD: Check if input is likely an answer to current question
+    def _route_new_incident(self, user_input: str, session_id: str, conversation_history: List[Dict],
+                            active_incidents: List[str], intent_data: Dict[str, Any]) -> Dict[str, Any]:
+        """NEW_INCIDENT: ask KEEP/IGNORE first when other incidents are active"""
+        if active_incidents:
+            return self._handle_new_incident_with_active(user_input, session_id, conversation_history, active_incidents)
+        return self._handle_new_incident(user_input, session_id, conversation_history)
+    
+    def _route_continue_incident(self, user_input: str, session_id: str, conversation_history: List[Dict],
+                                 active_incidents: List[str], intent_data: Dict[str, Any]) -> Dict[str, Any]:
+        """CONTINUE_INCIDENT: answer the latest pending incident, or start a new one"""
+        pending_incidents = self._get_pending_incidents(active_incidents, session_id)
+        if pending_incidents:
+            return self._continue_incident(pending_incidents[-1], user_input, session_id, conversation_history)
+        return self._handle_new_incident(user_input, session_id, conversation_history)
+    
+    def _handle_general_intent(self, user_input: str, session_id: str, conversation_history: List[Dict],
+                               on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """GENERAL_QUERY and any unknown intent"""
+        # Paraphrased general questions within a session reuse the earlier answer
+        response, query_vector = semantic_cache.get(session_id, user_input)
+        if response is None:
+            response = llm_service.handle_general_query(user_input, conversation_history, on_token)
+            if response != LLM_FALLBACK_RESPONSE:
+                semantic_cache.set(session_id, user_input, response, query_vector)
+        elif on_token is not None:
+            on_token(response)
+        self.update_session_context(session_id, user_input, response)
+        return {
+            'message': response,
+            'session_id': session_id,
+            'incident_id': None,
+            'status': None
+        }
+    
     def _is_likely_answer_to_current_question(self, user_input: str, active_incidents: List[str]) -> bool:
         """Check if user input is likely answering the current question"""
         if not active_incidents:
@@ -488,12 +575,7 @@ class IncidentService:
             current_incident = mongo_client.get_incident_by_id(current_incident_id)
             
             if current_incident and current_incident.get('status') == 'pending_info':
-                incident_conversation = current_incident.get('conversation_history', [])
-                last_question = ""
-                for msg in reversed(incident_conversation):
-                    if msg.get('role') == 'assistant':
-                        last_question = msg.get('content', '')
-                        break
+                last_question = self._get_last_assistant_question(current_incident)
                 
                 response = f"I understand you're asking about something else. Let's first complete your current incident.\n\n{last_question}"
             else:
@@ -559,7 +641,7 @@ class IncidentService:
             
             admin_message = incident.get('admin_message', '')
             if not admin_message:
-                admin_message = self._get_default_admin_message(incident.get('status', ''))
+                admin_message = DEFAULT_ADMIN_MESSAGES.get(incident.get('status', ''), '')
             
             incident_details = {
                 'incident_id': incident.get('incident_id'),
@@ -605,14 +687,10 @@ class IncidentService:
             }
         
         incident_id = active_incidents[-1]
-        incident = mongo_client.get_incident_by_id(incident_id)
+        # Close and fetch in one round-trip; the session $pull runs in the background
+        incident = mongo_client.close_incident_atomic(incident_id)
         
         if incident:
-            mongo_client.update_incident(incident_id, {
-                'status': 'closed',
-                'closed_on': datetime.utcnow()
-            })
-            
             self.remove_incident_from_session(session_id, incident_id)
             
             response = llm_service.generate_close_incident_confirmation(
@@ -672,7 +750,7 @@ class IncidentService:
     
     def _handle_previous_solution_id(self, user_input: str, session_id: str, conversation_history: List[Dict], active_incidents: List[str]) -> Dict[str, Any]:
         """Handle incident ID provided for previous solution/incomplete incident request"""
-        incident_id_match = re.search(r'INC\d+', user_input)
+        incident_id_match = _INC_ID_RE.search(user_input)
         
         if not incident_id_match:
             response = "I couldn't find a valid Incident ID in your message. Please provide the Incident ID (e.g., INC20251022150744):"
@@ -714,11 +792,7 @@ class IncidentService:
             missing_info = incident.get('missing_info', [])
             
             if incident_conversation:
-                last_question = ""
-                for msg in reversed(incident_conversation):
-                    if msg.get('role') == 'assistant':
-                        last_question = msg.get('content', '')
-                        break
+                last_question = self._get_last_assistant_question(incident)
                 
                 if last_question:
                     response = response_prefix + "Let's continue: " + last_question
@@ -817,33 +891,26 @@ class IncidentService:
     # In backend/services/incident_service.py
 # Replace the _handle_keep_ignore_response method with this fixed version:
 
-    def _handle_keep_ignore_response(self, user_input: str, session_id: str, conversation_history: List[Dict], active_incidents: List[str]) -> Dict[str, Any]:
+    def _handle_keep_ignore_response(self, user_input: str, session_id: str, conversation_history: List[Dict], active_incidents: List[str],
+                                     session: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Handle user's response to keep or ignore previous incident"""
         user_lower = user_input.lower().strip()
-        session = mongo_client.get_session(session_id)
+        if session is None:
+            session = mongo_client.get_session(session_id) or {}
         pending_query = session.get('pending_new_incident_query', '')
         
+        if not pending_query and ('ignore' in user_lower or 'keep' in user_lower):
+            # Nothing was queued: never feed the literal "keep"/"ignore" into KB search or the LLM
+            return self._handle_keep_ignore_without_query(user_lower, session_id, user_input, active_incidents)
+        
         if 'ignore' in user_lower:
             logger.info(f"User chose IGNORE - closing incidents: {active_incidents}")
             
-            # Delete all active incidents from database
-            for incident_id in active_incidents:
-                try:
-                    result = mongo_client.incidents_collection.delete_one({'incident_id': incident_id})
-                    if result.deleted_count > 0:
-                        logger.info(f"✅ Deleted incident: {incident_id}")
-                    else:
-                        logger.warning(f"⚠️ Could not delete incident: {incident_id}")
-                except Exception as e:
-                    logger.error(f"❌ Error deleting incident {incident_id}: {e}")
-            
-            # Clear the session completely
-            mongo_client.update_session(session_id, {
-                'conversation_context': [],
-                'active_incidents': [],
-                'pending_new_incident_query': None,
-                'awaiting_response': None
-            })
+            # Delete all active incidents and clear the session: one write per collection
+            session_buffer.discard(session_id)
+            deleted_count = mongo_client.delete_incidents_and_clear_session(session_id, active_incidents)
+            if deleted_count < len(active_incidents):
+                logger.warning(f"⚠️ Deleted {deleted_count} of {len(active_incidents)} incidents")
             
             logger.info(f"✅ Session cleared and incidents deleted for IGNORE choice")
             
@@ -852,6 +919,7 @@ class IncidentService:
         
         elif 'keep' in user_lower:
             logger.info(f"User chose KEEP - creating new incident alongside: {active_incidents}")
+            existing_incidents = list(session.get('active_incidents', []))
             
             # Create the new incident first
             kb_result = kb_service.search_kb(pending_query)
@@ -864,15 +932,17 @@ class IncidentService:
                 incident_data = {
                     'incident_id': new_incident_id,
                     'user_demand': pending_query,
+                    'incident_type': _incident_type_label(pending_query),
                     'session_id': session_id,
                     'status': 'pending_info',
                     'kb_id': best_match['kb_id'],
                     'collected_info': {},
                     'required_info': best_match['required_info'],
-                    'missing_info': best_match['required_info'].copy(),
+                    'missing_info': best_match['required_info'],
                     'questions': best_match['questions'],
                     'solution_steps': best_match['solution_steps'],
                     'conversation_history': [],
+                    'next_question_index': 0,
                     'is_new_kb_entry': False,
                     'needs_kb_approval': False,
                     'requires_kb_addition': False,
@@ -895,15 +965,17 @@ class IncidentService:
                     incident_data = {
                         'incident_id': new_incident_id,
                         'user_demand': pending_query,
+                        'incident_type': _incident_type_label(pending_query),
                         'session_id': session_id,
                         'status': 'pending_info',
                         'kb_id': None,
                         'collected_info': {},
                         'required_info': required_info,
-                        'missing_info': required_info.copy(),
+                        'missing_info': required_info,
                         'questions': questions,
                         'solution_steps': '',
                         'conversation_history': [],
+                        'next_question_index': 0,
                         'is_new_kb_entry': True,
                         'needs_kb_approval': True,
                         'requires_kb_addition': True,
@@ -915,9 +987,10 @@ class IncidentService:
                     mongo_client.create_incident(incident_data)
                     self.add_incident_to_session(session_id, new_incident_id)
             
-            # Get updated session with both incidents
-            updated_session = mongo_client.get_session(session_id)
-            all_incidents = updated_session.get('active_incidents', [])
+            # Session now holds the existing incidents plus the one just added
+            all_incidents = existing_incidents
+            if new_incident_id and new_incident_id not in existing_incidents:
+                all_incidents = existing_incidents + [new_incident_id]
             
             # ✅ NEW: Use LLM to generate the incident selection message dynamically
             incident_list_text = self._format_incident_list(all_incidents)
@@ -965,17 +1038,36 @@ class IncidentService:
                 ]
             }
 
+    def _handle_keep_ignore_without_query(self, user_lower: str, session_id: str, user_input: str,
+                                          active_incidents: List[str]) -> Dict[str, Any]:
+        """Answer a KEEP/IGNORE choice whose pending new-incident query was lost"""
+        if 'ignore' in user_lower:
+            session_buffer.discard(session_id)
+            mongo_client.delete_incidents_and_clear_session(session_id, active_incidents)
+            response = "Okay, I've cleared your previous incidents. Please describe the issue you're facing."
+            incident_id = None
+        else:
+            mongo_client.update_session(session_id, {
+                'awaiting_response': None,
+                'pending_new_incident_query': None
+            })
+            response = "Okay, I've kept your current incidents. Please describe the new issue you're facing."
+            incident_id = active_incidents[-1] if active_incidents else None
+        
+        self.update_session_context(session_id, user_input, response)
+        return {
+            'message': response,
+            'session_id': session_id,
+            'incident_id': incident_id,
+            'status': None
+        }
+
     def _is_answer_to_error_question(self, user_input: str, current_incident: Dict) -> bool:
         """Check if user is answering an error message question"""
         user_lower = user_input.lower().strip()
         
         # Get the last question asked
-        conversation = current_incident.get('conversation_history', [])
-        last_question = ""
-        for msg in reversed(conversation):
-            if msg.get('role') == 'assistant':
-                last_question = msg.get('content', '').lower()
-                break
+        last_question = self._get_last_assistant_question(current_incident).lower()
         
         # Check if last question was about errors
         is_error_question = any(word in last_question for word in ['error', 'error code', 'error message'])
@@ -988,23 +1080,39 @@ class IncidentService:
         
         return is_error_question and is_no_error_response
 
+    def _get_last_assistant_question(self, incident: Dict) -> str:
+        """Get the last assistant message of an incident conversation"""
+        if 'last_assistant_question' in incident:
+            return incident['last_assistant_question']
+        
+        # Incidents created before the field was denormalized
+        for msg in reversed(incident.get('conversation_history', [])):
+            if msg.get('role') == 'assistant':
+                return msg.get('content', '')
+        return ""
     
     def _format_incident_list(self, incident_ids: List[str]) -> str:
         """Format incident list - one per line with bullet"""
-        incident_lines = []
-        
-        for inc_id in incident_ids:
-            inc = mongo_client.get_incident_by_id(inc_id)
-            if inc:
-                issue_desc = inc.get('user_demand', 'Unknown issue')
-                # ✅ Format: • INC20251026125046 - outlook is not working
-                incident_lines.append(f"• {inc_id} - {issue_desc}")
+        # One round-trip for all IDs; the description is truncated server-side
+        incidents = mongo_client.aggregate_incidents([
+            {'$match': {'incident_id': {'$in': incident_ids}}},
+            {'$project': {
+                '_id': 0,
+                'incident_id': 1,
+                'short_demand': {'$substrCP': [{'$ifNull': ['$user_demand', 'Unknown issue']}, 0, 60]}
+            }}
+        ])
+        incidents_map = {inc['incident_id']: inc['short_demand'] for inc in incidents}
         
-        return "\n".join(incident_lines)
+        # ✅ Format: • INC20251026125046 - outlook is not working
+        return "\n".join(
+            f"• {inc_id} - {incidents_map[inc_id]}"
+            for inc_id in incident_ids if inc_id in incidents_map
+        )
     
     def _handle_incident_selection(self, user_input: str, session_id: str, conversation_history: List[Dict], active_incidents: List[str]) -> Dict[str, Any]:
         """Handle incident ID selection after user chose KEEP"""
-        incident_id_match = re.search(r'INC\d+', user_input)
+        incident_id_match = _INC_ID_RE.search(user_input)
         
         if not incident_id_match:
             # ✅ Use dynamic formatting
@@ -1024,7 +1132,7 @@ class IncidentService:
             }
         
         selected_incident_id = incident_id_match.group()
-        incident = mongo_client.get_incident_by_id(selected_incident_id)
+        incident = mongo_client.get_incident_summary(selected_incident_id)
         
         if not incident:
             response = f"❌ Incident **{selected_incident_id}** not found. Please provide a valid Incident ID from the list above:"
@@ -1042,6 +1150,8 @@ class IncidentService:
         
         if incident.get('status') == 'pending_info':
             logger.info(f"Continuing with incident {selected_incident_id}")
+            # The next-question prompt is built from the incident conversation
+            incident = mongo_client.get_incident_by_id(selected_incident_id) or incident
             dummy_input = "continue"
             return self._continue_incident(incident, dummy_input, session_id, conversation_history)
         
@@ -1065,8 +1175,23 @@ class IncidentService:
         
     def _handle_new_incident(self, user_input: str, session_id: str, conversation_history: List[Dict]) -> Dict[str, Any]:
         """Handle creating a new incident"""
-        # Search KB for matching entry
-        kb_result = kb_service.search_kb(user_input)
+        # Greetings and small talk never match a KB entry - skip the vector search
+        if llm_service.is_small_talk(user_input):
+            response = llm_service.handle_general_query(user_input, conversation_history)
+            self.update_session_context(session_id, user_input, response)
+            return {
+                'message': response,
+                'session_id': session_id,
+                'incident_id': None,
+                'status': None
+            }
+        
+        # Short input sharing no word with the KB cannot match an entry - skip the embedding + vector search
+        if not kb_service.should_search(user_input):
+            logger.info(f"Skipping KB search for short off-KB input: '{user_input[:50]}'")
+            kb_result = {'best_match': None}
+        else:
+            kb_result = kb_service.search_kb(user_input)
         
         if kb_result['best_match']:
             return self._create_new_incident(user_input, session_id, conversation_history, kb_result)
@@ -1087,14 +1212,21 @@ class IncidentService:
                     'status': None
                 }
     
-    def _get_pending_incidents(self, active_incident_ids: List[str]) -> List[Dict]:
+    def _get_pending_incidents(self, active_incident_ids: List[str], session_id: Optional[str] = None) -> List[Dict]:
         """Get pending incidents from list of IDs"""
-        pending = []
-        for inc_id in active_incident_ids:
-            incident = mongo_client.get_incident_by_id(inc_id)
-            if incident and incident.get('status') == 'pending_info':
-                pending.append(incident)
-        return pending
+        if not active_incident_ids:
+            return []
+        query: Dict[str, Any] = {
+            'incident_id': {'$in': active_incident_ids},
+            'status': 'pending_info'
+        }
+        if session_id:
+            # Served by the (session_id, status) index
+            query['session_id'] = session_id
+        incidents = mongo_client.get_incidents_by_filter(query)
+        # Keep the session's ordering; callers continue the most recent one
+        incidents_map = {inc['incident_id']: inc for inc in incidents}
+        return [incidents_map[inc_id] for inc_id in active_incident_ids if inc_id in incidents_map]
     
     def _create_new_incident(self, user_input: str, session_id: str, conversation_history: List[Dict], kb_result: Dict) -> Dict[str, Any]:
         """Create new incident with KB match"""
@@ -1102,20 +1234,35 @@ class IncidentService:
             best_match = kb_result['best_match']
             incident_id = generate_incident_id()
             
-            default_message = self._get_default_admin_message('pending_info')
+            default_message = DEFAULT_ADMIN_MESSAGES['pending_info']
+            
+            question = llm_service.generate_kb_question(
+                best_match,
+                user_input,
+                {},
+                best_match['required_info'],
+                conversation_history
+            )
             
             incident_data = {
                 'incident_id': incident_id,
                 'user_demand': user_input,
+                'incident_type': _incident_type_label(user_input),
                 'session_id': session_id,
                 'status': 'pending_info',
                 'kb_id': best_match['kb_id'],
                 'collected_info': {},
                 'required_info': best_match['required_info'],
-                'missing_info': best_match['required_info'].copy(),
+                'missing_info': best_match['required_info'],
                 'questions': best_match['questions'],
                 'solution_steps': best_match['solution_steps'],
-                'conversation_history': [],
+                # Opening exchange is written with the insert: one round trip, no follow-up $push
+                'conversation_history': [
+                    {'role': 'user', 'content': user_input},
+                    {'role': 'assistant', 'content': question}
+                ],
+                'last_assistant_question': question,
+                'next_question_index': 0,
                 'is_new_kb_entry': False,
                 'needs_kb_approval': False,
                 'requires_kb_addition': False,
@@ -1127,18 +1274,6 @@ class IncidentService:
             mongo_client.create_incident(incident_data)
             self.add_incident_to_session(session_id, incident_id)
             
-            question = llm_service.generate_kb_question(
-                best_match,
-                user_input,
-                {},
-                best_match['required_info'],
-                conversation_history
-            )
-            
-            incident_data['conversation_history'].append({'role': 'user', 'content': user_input})
-            incident_data['conversation_history'].append({'role': 'assistant', 'content': question})
-            mongo_client.update_incident(incident_id, {'conversation_history': incident_data['conversation_history']})
-            
             self.update_session_context(session_id, user_input, question)
             
             return {
@@ -1165,20 +1300,31 @@ class IncidentService:
             required_info = analysis.get('required_info', [])
             questions = analysis.get('clarifying_questions', [])
             
-            default_message = self._get_default_admin_message('pending_info')
+            default_message = DEFAULT_ADMIN_MESSAGES['pending_info']
+            
+            if questions:
+                question = questions[0]
+            else:
+                question = f"I understand you're experiencing an issue with: {user_input}. Can you provide more details about this problem?"
             
             incident_data = {
                 'incident_id': incident_id,
                 'user_demand': user_input,
+                'incident_type': _incident_type_label(user_input),
                 'session_id': session_id,
                 'status': 'pending_info',
                 'kb_id': None,
                 'collected_info': {},
                 'required_info': required_info,
-                'missing_info': required_info.copy(),
+                'missing_info': required_info,
                 'questions': questions,
                 'solution_steps': '',
-                'conversation_history': [],
+                'conversation_history': [
+                    {'role': 'user', 'content': user_input},
+                    {'role': 'assistant', 'content': question}
+                ],
+                'last_assistant_question': question,
+                'next_question_index': 1 if questions else 0,
                 'is_new_kb_entry': True,
                 'needs_kb_approval': True,
                 'requires_kb_addition': True,
@@ -1190,15 +1336,6 @@ class IncidentService:
             mongo_client.create_incident(incident_data)
             self.add_incident_to_session(session_id, incident_id)
             
-            if questions:
-                question = questions[0]
-            else:
-                question = f"I understand you're experiencing an issue with: {user_input}. Can you provide more details about this problem?"
-            
-            incident_data['conversation_history'].append({'role': 'user', 'content': user_input})
-            incident_data['conversation_history'].append({'role': 'assistant', 'content': question})
-            mongo_client.update_incident(incident_id, {'conversation_history': incident_data['conversation_history']})
-            
             self.update_session_context(session_id, user_input, question)
             
             logger.info(f"New incident created needing KB approval: {incident_id}")
@@ -1224,14 +1361,15 @@ class IncidentService:
         try:
             incident_id = incident['incident_id']
             collected_info = incident.get('collected_info', {})
-            missing_info = incident.get('missing_info', [])
+            missing_info = deque(incident.get('missing_info', []))
             incident_conversation = incident.get('conversation_history', [])
             
             if not missing_info:
-                return self._finalize_incident(incident_id, session_id, collected_info, incident_conversation, user_input)
+                return self._finalize_incident(incident_id, session_id, collected_info, [], user_input)
             
             current_field = missing_info[0] if missing_info else ""
-            incident_conversation.append({'role': 'user', 'content': user_input})
+            user_message = {'role': 'user', 'content': user_input}
+            incident_conversation.append(user_message)
             
             user_lower = user_input.lower().strip()
             extracted_value = None
@@ -1292,17 +1430,11 @@ class IncidentService:
             
             if is_valid and extracted_value:
                 collected_info[current_field] = extracted_value
-                missing_info.pop(0)
+                missing_info.popleft()
                 logger.info(f"✅ Successfully collected '{current_field}': {extracted_value}")
                 
-                mongo_client.update_incident(incident_id, {
-                    'conversation_history': incident_conversation,
-                    'collected_info': collected_info,
-                    'missing_info': missing_info
-                })
-                
                 if not missing_info:
-                    return self._finalize_incident(incident_id, session_id, collected_info, incident_conversation, user_input)
+                    return self._finalize_incident(incident_id, session_id, collected_info, [user_message], user_input)
                 
                 # Generate next question
                 if incident.get('kb_id'):
@@ -1312,24 +1444,29 @@ class IncidentService:
                             kb_entry,
                             user_input,
                             collected_info,
-                            missing_info,
+                            list(missing_info),
                             incident_conversation
                         )
                     else:
                         next_question = f"Can you provide information about: {missing_info[0]}?"
                 else:
                     questions = incident.get('questions', [])
-                    questions_asked = len(collected_info)
+                    # Older incidents have no pointer; fall back to the number of answers collected
+                    next_question_index = incident.get('next_question_index', len(collected_info))
                     
-                    if questions_asked < len(questions):
-                        next_question = questions[questions_asked]
+                    if next_question_index < len(questions):
+                        next_question = questions[next_question_index]
                     else:
                         next_question = f"Can you provide information about: {missing_info[0]}?"
                 
-                incident_conversation.append({'role': 'assistant', 'content': next_question})
-                mongo_client.update_incident(incident_id, {
-                    'conversation_history': incident_conversation
-                })
+                session_writer.submit(session_id, mongo_client.append_incident_conversation, incident_id, [
+                    user_message,
+                    {'role': 'assistant', 'content': next_question}
+                ], {
+                    'collected_info': collected_info,
+                    'missing_info': list(missing_info),
+                    'last_assistant_question': next_question
+                }, {'next_question_index': 1})
                 
                 self.update_session_context(session_id, user_input, next_question)
                 
@@ -1343,18 +1480,14 @@ class IncidentService:
             else:
                 logger.warning(f"⚠️ Invalid response for '{current_field}': {user_input}")
                 
-                last_question = ""
-                for msg in reversed(incident_conversation):
-                    if msg.get('role') == 'assistant':
-                        last_question = msg.get('content', '')
-                        break
+                last_question = self._get_last_assistant_question(incident)
                 
                 followup = f"I need specific information about: {current_field}. {last_question}"
-                incident_conversation.append({'role': 'assistant', 'content': followup})
                 
-                mongo_client.update_incident(incident_id, {
-                    'conversation_history': incident_conversation
-                })
+                session_writer.submit(session_id, mongo_client.append_incident_conversation, incident_id, [
+                    user_message,
+                    {'role': 'assistant', 'content': followup}
+                ], {'last_assistant_question': followup})
                 
                 self.update_session_context(session_id, user_input, followup)
                 
@@ -1366,9 +1499,7 @@ class IncidentService:
                 }
             
         except Exception as e:
-            logger.error(f"❌ Error continuing incident: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"❌ Error continuing incident: {e}")
             return {
                 'message': "I apologize, but I encountered an error processing your response. Please try again.",
                 'session_id': session_id,
@@ -1377,16 +1508,17 @@ class IncidentService:
             }
 
     
-    def _finalize_incident(self, incident_id: str, session_id: str, collected_info: Dict, conversation: List, user_input: str) -> Dict:
+    def _finalize_incident(self, incident_id: str, session_id: str, collected_info: Dict, new_messages: List, user_input: str) -> Dict:
         """Finalize and close incident collection"""
-        default_message = self._get_default_admin_message('open')
+        default_message = DEFAULT_ADMIN_MESSAGES['open']
         
         final_message = llm_service.generate_incident_completion_message(incident_id)
-        conversation.append({'role': 'assistant', 'content': final_message})
         
-        mongo_client.update_incident(incident_id, {
+        session_writer.submit(session_id, mongo_client.append_incident_conversation, incident_id, new_messages + [
+            {'role': 'assistant', 'content': final_message}
+        ], {
             'status': 'open',
-            'conversation_history': conversation,
+            'last_assistant_question': final_message,
             'collected_info': collected_info,
             'missing_info': [],
             'admin_message': default_message,
@@ -1423,41 +1555,19 @@ class IncidentService:
     
     def _is_asking_about_previous_solution(self, user_input: str) -> bool:
         """Check if user is asking about a previous incident/solution"""
-        keywords = ['previous', 'last', 'earlier', 'before', 'my incident', 'solution', 'what happened', 'status', 'view solution', 'continue my', 'old incident']
-        user_lower = user_input.lower()
-        return any(keyword in user_lower for keyword in keywords)
+        return _PREV_SOL_RE.search(user_input) is not None
 
     def _handle_previous_solution_query(self, user_input: str, session_id: str, conversation_history: List[Dict]) -> Dict[str, Any]:
         """Handle queries about previous solutions"""
-        incident_id_match = re.search(r'INC\d+', user_input)
+        incident_id_match = _INC_ID_RE.search(user_input)
         
         if incident_id_match:
             incident_id = incident_id_match.group()
-            incident = mongo_client.get_incident_by_id(incident_id)
+            incident = mongo_client.get_incident_by_id(incident_id, projection=STATUS_VIEW_PROJECTION)
             
             if incident:
-                if incident.get('status') == 'pending_info':
-                    response = f"I found your incident {incident_id}. Let's continue from where we left off.\n\n"
-                    return self._continue_incident(incident, user_input, session_id, conversation_history)
-                else:
-                    incident_details = {
-                        'incident_id': incident.get('incident_id'),
-                        'status': incident.get('status'),
-                        'user_demand': incident.get('user_demand'),
-                        'collected_info': incident.get('collected_info', {}),
-                        'solution_steps': incident.get('solution_steps', 'Not yet provided'),
-                        'admin_message': incident.get('admin_message', '')
-                    }
-                    
-                    response = llm_service.generate_incident_status_response(incident_details)
-                    self.update_session_context(session_id, user_input, response)
-                    
-                    return {
-                        'message': response,
-                        'session_id': session_id,
-                        'incident_id': incident_id,
-                        'status': incident.get('status')
-                    }
+                handler = self._prev_sol_handlers.get(incident.get('status'), self._show_incident_details)
+                return handler(incident, user_input, session_id, conversation_history)
             else:
                 response = f"I couldn't find incident {incident_id}. Please check the ID and try again."
                 self.update_session_context(session_id, user_input, response)
@@ -1477,65 +1587,74 @@ class IncidentService:
                 'status': 'awaiting_incident_id'
             }
         
-    def _get_default_admin_message(self, status: str) -> str:
-        """Get default admin message based on incident status"""
-        return llm_service.generate_default_admin_message(status)
-
+    def _resume_pending_incident(self, incident: Dict[str, Any], user_input: str, session_id: str, conversation_history: List[Dict]) -> Dict[str, Any]:
+        """Continue collecting information for an incident that is still pending"""
+        # Continuing needs the full document (questions, history, missing info)
+        incident = mongo_client.get_incident_by_id(incident['incident_id']) or incident
+        return self._continue_incident(incident, user_input, session_id, conversation_history)
+    
+    def _show_incident_details(self, incident: Dict[str, Any], user_input: str, session_id: str, conversation_history: List[Dict]) -> Dict[str, Any]:
+        """Describe the current status of an incident to the user"""
+        incident_details = {
+            'incident_id': incident.get('incident_id'),
+            'status': incident.get('status'),
+            'user_demand': incident.get('user_demand'),
+            'collected_info': incident.get('collected_info', {}),
+            'solution_steps': incident.get('solution_steps', 'Not yet provided'),
+            'admin_message': incident.get('admin_message', '')
+        }
+        
+        response = llm_service.generate_incident_status_response(incident_details)
+        self.update_session_context(session_id, user_input, response)
+        
+        return {
+            'message': response,
+            'session_id': session_id,
+            'incident_id': incident.get('incident_id'),
+            'status': incident.get('status')
+        }
+        
     # Admin methods
     def get_incident(self, incident_id: str) -> Optional[Dict[str, Any]]:
         return mongo_client.get_incident_by_id(incident_id)
     
     def get_all_incidents(self) -> List[Dict[str, Any]]:
-        incidents = mongo_client.get_all_incidents()
+        incidents = mongo_client.aggregate_incidents(_list_view_pipeline({}))
         logger.info(f"Retrieved {len(incidents)} incidents from database")
-        
-        for incident in incidents:
-            if 'incident_type' not in incident:
-                user_demand = incident.get('user_demand', 'IT Issue')
-                if len(user_demand) > 50:
-                    incident['incident_type'] = user_demand[:50] + '...'
-                else:
-                    incident['incident_type'] = user_demand
-            
-            if 'use_case' not in incident:
-                incident['use_case'] = incident.get('user_demand', 'Unknown Issue')
-            
-            if 'needs_kb_approval' not in incident:
-                incident['needs_kb_approval'] = False
-            
-            if 'is_new_kb_entry' not in incident:
-                incident['is_new_kb_entry'] = False
-            
-            if 'admin_message' not in incident:
-                incident['admin_message'] = ''
-        
         return incidents
     
+    def get_incident_flags(self) -> List[Dict[str, Any]]:
+        """Status and KB-approval flag of every incident, for dashboard counts"""
+        return mongo_client.get_all_incidents(STATS_PROJECTION)
+    
     def get_incidents_by_status(self, status: str) -> List[Dict[str, Any]]:
-        incidents = mongo_client.get_incidents_by_filter({'status': status})
-        for incident in incidents:
-            if 'incident_type' not in incident:
-                incident['incident_type'] = incident.get('user_demand', 'IT Issue')[:50] + '...' if len(incident.get('user_demand', '')) > 50 else incident.get('user_demand', 'IT Issue')
-        return incidents
+        return mongo_client.aggregate_incidents(_list_view_pipeline({'status': status}))
+    
+    def get_filtered_incidents(self, status: Optional[str] = None,
+                               needs_kb_approval: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Get incidents matching the admin filters, filtered in Mongo"""
+        match: Dict[str, Any] = {}
+        if status:
+            match['status'] = status
+        if needs_kb_approval is not None:
+            # Legacy incidents without the flag count as not needing approval
+            match['needs_kb_approval'] = True if needs_kb_approval else {'$ne': True}
+        return mongo_client.aggregate_incidents(_list_view_pipeline(match))
     
     def get_incidents_needing_approval(self) -> List[Dict[str, Any]]:
-        incidents = mongo_client.get_incidents_by_filter({
+        return mongo_client.aggregate_incidents(_list_view_pipeline({
             '$or': [
                 {'needs_kb_approval': True},
                 {'requires_kb_addition': True},
                 {'is_new_kb_entry': True}
             ]
-        })
-        for incident in incidents:
-            if 'incident_type' not in incident:
-                incident['incident_type'] = incident.get('user_demand', 'IT Issue')[:50] + '...' if len(incident.get('user_demand', '')) > 50 else incident.get('user_demand', 'IT Issue')
-        return incidents
+        }))
     
     def update_incident_status(self, incident_id: str, status: str) -> bool:
         try:
             valid_statuses = ['pending_info', 'open', 'resolved']
             if status not in valid_statuses:
-                logger.error(f"Invalid status: {status}. Valid statuses: {valid_statuses}")
+                logger.error("Invalid status: %s. Valid statuses: %s", status, valid_statuses)
                 return False
             
             current_incident = mongo_client.get_incident_by_id(incident_id)
@@ -1543,18 +1662,8 @@ class IncidentService:
             
             update_data = {'status': status}
             
-            if status in ['pending_info', 'open'] and (not current_admin_message or current_admin_message in [
-                'Still need some information.',
-                'All information collected. Our team will contact you soon.',
-                'Incident has been resolved successfully.'
-            ]):
-                update_data['admin_message'] = self._get_default_admin_message(status)
-            elif status == 'resolved' and (not current_admin_message or current_admin_message in [
-                'Still need some information.',
-                'All information collected. Our team will contact you soon.',
-                'Incident has been resolved successfully.'
-            ]):
-                update_data['admin_message'] = self._get_default_admin_message(status)
+            if not current_admin_message or current_admin_message in _STALE_ADMIN_MESSAGES:
+                update_data['admin_message'] = DEFAULT_ADMIN_MESSAGES.get(status, '')
             
             if status == 'resolved':
                 update_data['resolved_on'] = datetime.utcnow()
@@ -1562,66 +1671,68 @@ class IncidentService:
             success = mongo_client.update_incident(incident_id, update_data)
             
             if success:
-                logger.info(f"Successfully updated incident {incident_id} status to {status}")
+                logger.info("Successfully updated incident %s status to %s", incident_id, status)
             else:
-                logger.error(f"Failed to update incident {incident_id} status")
+                logger.error("Failed to update incident %s status", incident_id)
             
             return success
             
-        except Exception as e:
-            logger.error(f"Error updating incident status: {e}")
+        except Exception:
+            logger.exception("Error updating incident status", extra={'incident_id': incident_id})
             return False
     
     def approve_kb_entry(self, incident_id: str, solution_steps: str) -> bool:
         try:
-            logger.info(f"Approving KB entry for incident {incident_id}")
+            # Copied per call: update_incident adds updated_on to the dict it is given
+            update_data = KB_APPROVAL_UPDATE_TEMPLATE.copy()
+            update_data['solution_steps'] = solution_steps
             
-            incident = mongo_client.get_incident_by_id(incident_id)
+            # Only the fields needed to create the KB entry
+            incident = mongo_client.get_incident_by_id(incident_id, projection=KB_APPROVAL_PROJECTION)
             
             if not incident:
-                logger.error(f"Incident not found: {incident_id}")
+                logger.error("Incident not found: %s", incident_id)
                 return False
             
-            update_data = {
-                'solution_steps': solution_steps,
-                'needs_kb_approval': False,
-                'requires_kb_addition': False
-            }
+            # Existing KB entry: just record the approval
+            if not incident.get('is_new_kb_entry'):
+                success = mongo_client.update_incident(incident_id, update_data)
+                if success:
+                    logger.info("KB entry approved for incident %s", incident_id,
+                                extra={'event': 'kb_approved', 'incident_id': incident_id})
+                return success
             
-            success = mongo_client.update_incident(incident_id, update_data)
+            use_case = incident.get('user_demand', 'Unknown Issue')
+            required_info = incident.get('required_info', [])
+            
+            # The KB entry doesn't depend on the incident update, so create it first
+            # and record the approval and the new kb_id in a single write; the embedding
+            # and ChromaDB add run in the background once the kb_id is assigned
+            new_kb_id = kb_service.submit_new_kb_entry(
+                use_case=use_case,
+                required_info=required_info,
+                solution_steps=[solution_steps],
+                questions=incident.get('questions', [])
+            )
             
-            if success and incident.get('is_new_kb_entry'):
-                use_case = incident.get('user_demand', 'Unknown Issue')
-                required_info = incident.get('required_info', [])
-                
-                logger.info(f"Creating new KB entry for: {use_case}")
-                
-                new_kb_id = kb_service.add_new_kb_entry(
-                    use_case=use_case,
-                    required_info=required_info,
-                    solution_steps=[solution_steps],
-                    questions=incident.get('questions', [])
-                )
-                
-                if new_kb_id:
-                    mongo_client.update_incident(incident_id, {
-                        'kb_id': new_kb_id,
-                        'is_new_kb_entry': False
-                    })
-                    
-                    kb_service.append_to_kb_file(new_kb_id, use_case, required_info, [solution_steps])
-                    logger.info(f"New KB entry created: {new_kb_id} for incident: {incident_id}")
-                    return True
-                else:
-                    logger.error("Failed to create new KB entry")
-                    return False
-            else:
-                return success
+            if not new_kb_id:
+                logger.error("Failed to create new KB entry")
+                mongo_client.update_incident(incident_id, update_data)
+                return False
             
-        except Exception as e:
-            logger.error(f"Error approving KB entry: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+            # Queue the kb_data.txt append first so the writer thread overlaps it with the Mongo write
+            kb_writer.submit(new_kb_id, use_case, required_info, [solution_steps])
+            
+            update_data['kb_id'] = new_kb_id
+            update_data['is_new_kb_entry'] = False
+            mongo_client.update_incident(incident_id, update_data)
+            logger.info("New KB entry created: %s for incident: %s (%s)", new_kb_id, incident_id, use_case,
+                        extra={'event': 'kb_added', 'incident_id': incident_id,
+                               'kb_id': new_kb_id, 'use_case': use_case})
+            return True
+            
+        except Exception:
+            logger.exception("Error approving KB entry", extra={'incident_id': incident_id})
             return False
 
 # Global incident service instance
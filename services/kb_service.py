@@ -2,44 +2,104 @@
 from db.chroma import chroma_client
 from db.mongo import mongo_client
 from services.embedding_wrapper import embedding_service
+from core.config import settings
 from utils.preprocessing import parse_kb_file
 from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import logging
 import os
+import queue
+import re
+import threading
+import time
+import numpy as np
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+KB_ENTRY_CACHE_SIZE = 512
+KB_APPEND_BATCH_WINDOW = 0.05  # seconds to wait for more appends before writing
+KB_APPEND_MAX_BATCH = 32
+KB_ID_COUNTER = "kb_id"
+EMBEDDING_CACHE_SIZE = 4096
+EMBEDDING_BATCH_SIZE = 32  # texts per embedding API request
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+QUERY_EMBEDDING_CACHE_TTL = 3600  # seconds a cached search query embedding stays valid
+_KB_COUNT_WIDTH = 8  # the entry count is space-padded so the header never changes length
+# Header of kb_data.txt; rewritten in place when its layout matches
+_KB_HEADER_RE = re.compile(rb'# Knowledge Base Entries\n# Last Updated: [0-9: -]{19}\n# Total Entries: [0-9 ]{%d}\n\n' % _KB_COUNT_WIDTH)
+# Words used by the KB vocabulary gate and the follow-up check; keeps 3-letter terms like vpn, sso, mfa
+_CONTENT_WORD_RE = re.compile(r'[a-z0-9]{3,}')
+_STOP_WORDS = frozenset({
+    'the', 'and', 'for', 'not', 'with', 'can', 'you', 'are', 'how', 'what', 'this', 'that',
+    'have', 'has', 'was', 'but', 'get', 'its', 'from', 'when', 'any', 'all', 'now', 'too'
+})
+KB_KEYWORD_BONUS = 0.15  # per unit of Jaccard overlap; 0.3 on the old 2*cos - 1 scale
+
+# One kb_data.txt entry; the blocks are pre-joined "- item\n" lines
+_KB_ENTRY_TEMPLATE = ("\n" + "=" * 50 + "\n[KB_ID: {kb_number}]\n\nUse Case: {use_case}\n\n"
+                      "{required_block}Solution Steps:\n{steps_block}" + "-" * 50)
+
+# Default question for a required-info field, by the first keyword group found in it
+_QUESTION_RULES = (
+    (('operating system', 'os'), "What operating system are you using?"),
+    (('error message', 'error code'), "Are you seeing any error messages? If yes, what does it say?"),
+    (('account type',), "What type of account is this?"),
+    (('device',), "What is your device name or ID?"),
+)
+
+
+def encode_list_metadata(values: List[str]) -> str:
+    """Chroma metadata values must be scalars, so lists are stored as compact JSON"""
+    return json.dumps(list(values), separators=(',', ':'))
+
+
+def decode_list_metadata(value: Optional[str]) -> List[str]:
+    """Inverse of encode_list_metadata; also reads the legacy comma-joined format"""
+    if not value:
+        return []
+    if value.startswith('['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value.split(',')
+
+
 class KBService:
     def __init__(self):
-        self.similarity_threshold = 0.35
-        self.kb_file_path = self._get_kb_file_path()  # Initialize file path
-
-    def _get_kb_file_path(self):
-        """Get the correct path to kb_data.txt"""
-        import os
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        # Try multiple possible locations
-        possible_paths = [
-            os.path.join(current_dir, "..", "knowledge_base", "docs", "kb_data.txt"),
-            os.path.join(current_dir, "knowledge_base", "docs", "kb_data.txt"),
-            "knowledge_base/docs/kb_data.txt",
-            "../knowledge_base/docs/kb_data.txt",
-            os.path.join(os.getcwd(), "knowledge_base", "docs", "kb_data.txt")
-        ]
-        
-        for path in possible_paths:
-            full_path = os.path.abspath(path)
-            if os.path.exists(full_path):
-                logger.info(f"Found KB file at: {full_path}")
-                return full_path
-        
-        # If no file exists, create one in the most likely location
-        default_path = os.path.join(current_dir, "..", "knowledge_base", "docs", "kb_data.txt")
-        os.makedirs(os.path.dirname(default_path), exist_ok=True)
-        logger.info(f"Using default KB file path: {default_path}")
-        return default_path
+        # Cosine similarity; 0.35 on the old "1 - squared L2" scale (= 2*cos - 1) was cos 0.675
+        self.similarity_threshold = 0.675
+        self.kb_file_path = settings.KB_FILE_PATH  # the directory is created on first append
+        # LRU of parsed KB entries, keyed by kb_id
+        self._kb_entry_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._kb_entry_lock = threading.Lock()
+        # Words from KB use cases and required info; empty means "unknown", never reject
+        self.kb_vocabulary: frozenset = frozenset()
+        # kb_id -> (use_case, its word set) for the keyword-overlap bonus
+        self._use_case_word_sets: Dict[str, tuple] = {}
+        # Normalized use case -> kb_id, so a query naming a use case verbatim skips the vector search
+        self._exact_by_use_case: Dict[str, str] = {}
+        # The Mongo kb_id counter is raised to the highest existing KB number once per process
+        self._kb_counter_seeded = False
+        # LRU of KB text embeddings (float16) keyed by content hash, backed by Mongo's embedding_cache
+        self._embed_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embed_cache_lock = threading.Lock()
+        # Short-lived LRU of search query embeddings keyed by (model, normalized query); not persisted
+        self._query_embed_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._query_embed_lock = threading.Lock()
+        # Embeds and indexes approved entries off the request path, one at a time
+        self._indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kb-indexer")
+        # Long-lived O_APPEND descriptor for kb_data.txt, opened on first append
+        self._kb_fd: Optional[int] = None
+        self._kb_fd_path: Optional[str] = None
+        self._kb_file_lock = threading.Lock()
+        self._kb_header_stale = False
+        # Number of [KB_ID:] entries in kb_data.txt, counted once on the first append
+        self._kb_entry_count: Optional[int] = None
 
     def initialize_kb_from_file(self, file_path: str) -> bool:
         """Load knowledge base from file and store in ChromaDB"""
@@ -56,26 +116,33 @@ class KBService:
                 logger.warning("No KB entries found in file")
                 return False
             
-            for entry in kb_entries:
-                embedding = embedding_service.generate_embedding(entry['use_case'])
-                
-                if embedding:
-                    metadata = {
-                        'use_case': entry['use_case'],
-                        'required_info': ','.join(entry['required_info']),
-                        'questions': ','.join(entry['questions']),
-                        'solution_steps': entry['solution_steps']
-                    }
-                    
-                    chroma_client.add_kb_entry(
-                        kb_id=entry['kb_id'],
-                        text=entry['full_text'],
-                        embedding=embedding,
-                        metadata=metadata
-                    )
-                    
-                    logger.info(f"Added KB entry: {entry['kb_id']}")
-            
+            # One embedding request and one ChromaDB add for the whole file
+            embeddings = self._cached_embed_batch([entry['use_case'] for entry in kb_entries])
+            loaded = {}
+            for entry, embedding in zip(kb_entries, embeddings):
+                if not embedding:
+                    logger.error(f"Failed to generate embedding for KB entry: {entry['kb_id']}")
+                elif entry['kb_id'] not in loaded:  # a batch add rejects duplicate ids outright
+                    loaded[entry['kb_id']] = (entry, embedding)
+            loaded = list(loaded.values())
+            
+            chroma_client.add_kb_entries_batch(
+                ids=[entry['kb_id'] for entry, _ in loaded],
+                texts=[entry['full_text'] for entry, _ in loaded],
+                embeddings=[embedding for _, embedding in loaded],
+                metadatas=[{
+                    'use_case': entry['use_case'],
+                    'required_info': encode_list_metadata(entry['required_info']),
+                    'questions': encode_list_metadata(entry['questions']),
+                    'solution_steps': entry['solution_steps']
+                } for entry, _ in loaded]
+            )
+            
+            self._extend_vocabulary(
+                f"{entry['use_case']} {' '.join(entry['required_info'])}" for entry in kb_entries
+            )
+            for entry, _ in loaded:
+                self._register_use_case(entry['kb_id'], entry['use_case'])
             logger.info(f"Successfully initialized KB with {len(kb_entries)} entries")
             return True
             
@@ -83,89 +150,180 @@ class KBService:
             logger.error(f"Error initializing KB: {e}")
             return False
     
+    def _embedding_key(self, text: str) -> str:
+        return hashlib.blake2b(f"{embedding_service.model}\0{text}".encode('utf-8'), digest_size=16).hexdigest()
+
+    def _cached_embed(self, text: str) -> List[float]:
+        """Embed KB text, reusing any earlier embedding of the same text and model"""
+        return self._cached_embed_batch([text])[0]
+
+    def _embed_chunk(self, chunk: List[tuple]) -> Dict[str, np.ndarray]:
+        embeddings = embedding_service.generate_embeddings_batch([text for _, text in chunk])
+        if not embeddings:
+            return {}
+        return {key: np.asarray(embedding, dtype=np.float16) for (key, _), embedding in zip(chunk, embeddings)}
+
+    def _cached_embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed several KB texts with one cache lookup and one API call for the misses; [] marks a failure"""
+        keys = [self._embedding_key(text) for text in texts]
+        # Cached vectors are float16 arrays: a quarter of the memory of a list of Python floats
+        found: Dict[str, np.ndarray] = {}
+        with self._embed_cache_lock:
+            for key in keys:
+                if key in self._embed_cache:
+                    self._embed_cache.move_to_end(key)
+                    found[key] = self._embed_cache[key]
+        
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        found.update(mongo_client.get_cached_embeddings(missing))
+        
+        to_embed = list({key: text for key, text in zip(keys, texts) if key not in found}.items())
+        # Bounded requests: a failed chunk only loses its own texts
+        chunks = [to_embed[start:start + EMBEDDING_BATCH_SIZE] for start in range(0, len(to_embed), EMBEDDING_BATCH_SIZE)]
+        if len(chunks) > 1:
+            # Keep several requests in flight instead of paying each round trip in turn
+            with ThreadPoolExecutor(max_workers=min(settings.EMBEDDING_WORKERS, len(chunks)),
+                                    thread_name_prefix="kb-embed") as pool:
+                results = list(pool.map(self._embed_chunk, chunks))
+        else:
+            results = [self._embed_chunk(chunk) for chunk in chunks]
+        generated = {}
+        for result in results:
+            generated.update(result)
+        if generated:
+            mongo_client.store_embeddings(generated)
+            found.update(generated)
+        
+        with self._embed_cache_lock:
+            for key in missing:
+                if key in found:
+                    self._embed_cache[key] = found[key]
+            while len(self._embed_cache) > EMBEDDING_CACHE_SIZE:
+                self._embed_cache.popitem(last=False)
+        return [found[key].astype(np.float32).tolist() if key in found else [] for key in keys]
+
+    def _extend_vocabulary(self, texts):
+        words = set(self.kb_vocabulary)
+        for text in texts:
+            words.update(self._content_words(text))
+        self.kb_vocabulary = frozenset(words)
+
+    def load_vocabulary(self):
+        """Build the KB vocabulary from the entries already stored in ChromaDB"""
+        try:
+            entries = chroma_client.get_all_entries()
+            self._extend_vocabulary(
+                f"{entry.get('metadata', {}).get('use_case', '')} {entry.get('metadata', {}).get('required_info', '')}"
+                for entry in entries
+            )
+            for entry in entries:
+                self._register_use_case(entry['id'], entry.get('metadata', {}).get('use_case', ''))
+            logger.info(f"KB vocabulary loaded: {len(self.kb_vocabulary)} words")
+        except Exception as e:
+            logger.error(f"Error loading KB vocabulary: {e}")
+
+    def migrate_list_metadata(self, entries: Optional[List[Dict[str, Any]]] = None) -> int:
+        """One-time rewrite of comma-joined required_info/questions metadata to JSON"""
+        try:
+            if entries is None:
+                entries = chroma_client.get_all_entries()
+            ids, metadatas = [], []
+            for entry in entries:
+                metadata = dict(entry.get('metadata') or {})
+                legacy = False
+                for field in ('required_info', 'questions'):
+                    value = metadata.get(field)
+                    if value and not value.startswith('['):
+                        metadata[field] = encode_list_metadata(decode_list_metadata(value))
+                        legacy = True
+                if legacy:
+                    ids.append(entry['id'])
+                    metadatas.append(metadata)
+            if ids and chroma_client.update_metadatas(ids, metadatas):
+                logger.info(f"Migrated list metadata of {len(ids)} KB entries to JSON")
+            return len(ids)
+        except Exception as e:
+            logger.error(f"Error migrating KB list metadata: {e}")
+            return 0
+
+    def might_match(self, query: str) -> bool:
+        """Cheap pre-check: False only when the query shares no word with any KB entry"""
+        if not self.kb_vocabulary:
+            return True
+        return not self.kb_vocabulary.isdisjoint(self._content_words(query))
+
+    def should_search(self, query: str) -> bool:
+        """False for short input that shares no word with the KB, so the embedding + vector search can be skipped"""
+        return len(query.split()) >= 3 or self.might_match(query)
+
     def append_to_kb_file(self, kb_id: str, use_case: str, required_info: List[str], solution_steps: List[str]):
         """Append new KB entry to kb_data.txt file with proper formatting"""
+        logger.info(f"=== STARTING KB FILE APPEND ===")
+        logger.info(f"KB ID: {kb_id}")
+        logger.info(f"Use Case: {use_case}")
+        logger.info(f"File Path: {self.kb_file_path}")
+        
+        new_entry = self._format_kb_entry(kb_id, use_case, required_info, solution_steps)
+        success = self._write_kb_entries([new_entry])
+        
+        if success:
+            self.refresh_kb_file_header()
+            logger.info(f"=== KB FILE APPEND COMPLETED ===")
+        return success
+
+    def _format_kb_entry(self, kb_id: str, use_case: str, required_info: List[str], solution_steps: List[str]) -> str:
+        """Format a KB entry exactly like the existing entries in kb_data.txt"""
+        # Extract KB number from kb_id
+        if kb_id.startswith('KB_'):
+            kb_number = kb_id.split('_')[1]
+        else:
+            kb_number = kb_id[2:] if kb_id.startswith('KB') else kb_id
+        
+        if isinstance(solution_steps, list):
+            # Ensure each step starts with a bullet point
+            steps = solution_steps
+        else:
+            # If it's a string, split by newlines and format as bullets
+            steps = [step.strip() for step in solution_steps.split('\n') if step.strip()]
+        
+        # Format the new entry exactly like existing entries
+        return _KB_ENTRY_TEMPLATE.format(
+            kb_number=kb_number,
+            use_case=use_case,
+            required_block="Required Info:\n" + "".join(f"- {info}\n" for info in required_info) + "\n" if required_info else "",
+            steps_block="".join(f"{step}\n" if step.strip().startswith('-') else f"- {step}\n" for step in steps)
+        )
+
+    def _write_kb_entries(self, new_entries: List[str]) -> bool:
+        """Append one or more formatted entries to kb_data.txt; the header is refreshed separately"""
         try:
-            logger.info(f"=== STARTING KB FILE APPEND ===")
-            logger.info(f"KB ID: {kb_id}")
-            logger.info(f"Use Case: {use_case}")
-            logger.info(f"File Path: {self.kb_file_path}")
-            
             if not self.kb_file_path:
                 logger.error("❌ KB file path not set")
                 return False
             
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(self.kb_file_path), exist_ok=True)
-            logger.info(f"Directory ensured: {os.path.dirname(self.kb_file_path)}")
-            
-            # Check if file exists and read current content
-            file_exists = os.path.exists(self.kb_file_path)
-            current_content = ""
-            
-            if file_exists:
-                with open(self.kb_file_path, 'r', encoding='utf-8') as f:
-                    current_content = f.read()
-                current_size = len(current_content)
-                logger.info(f"📄 File exists, current size: {current_size} bytes")
-            else:
-                logger.info("📄 File does not exist, will create new file")
-                # Create initial header for new file
-                current_content = "# Knowledge Base Entries\n"
-                current_content += f"# Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                current_content += "# Total Entries: 0\n\n"
-            
-            # Extract KB number from kb_id
-            if kb_id.startswith('KB_'):
-                kb_number = kb_id.split('_')[1]
-            else:
-                kb_number = kb_id[2:] if kb_id.startswith('KB') else kb_id
-            
-            # Format the new entry exactly like existing entries
-            new_entry = f"\n{'='*50}\n"
-            new_entry += f"[KB_ID: {kb_number}]\n\n"
-            new_entry += f"Use Case: {use_case}\n\n"
-            
-            if required_info:
-                new_entry += "Required Info:\n"
-                for info in required_info:
-                    new_entry += f"- {info}\n"
-                new_entry += "\n"
-            
-            new_entry += "Solution Steps:\n"
-            if isinstance(solution_steps, list):
-                for step in solution_steps:
-                    # Ensure each step starts with a bullet point
-                    if not step.strip().startswith('-'):
-                        new_entry += f"- {step}\n"
-                    else:
-                        new_entry += f"{step}\n"
-            else:
-                # If it's a string, split by newlines and format as bullets
-                steps = solution_steps.split('\n')
-                for step in steps:
-                    step_clean = step.strip()
-                    if step_clean and not step_clean.startswith('-'):
-                        new_entry += f"- {step_clean}\n"
-                    elif step_clean:
-                        new_entry += f"{step_clean}\n"
-            
-            new_entry += f"{'-'*50}"
-            
-            logger.info(f"New entry length: {len(new_entry)} characters")
-            
-            # Append to file
-            with open(self.kb_file_path, 'w', encoding='utf-8') as f:
-                f.write(current_content + new_entry)
+            new_text = "".join(new_entries)
+            logger.info(f"Writing {len(new_entries)} new entries, {len(new_text)} characters")
             
-            # Verify the write
-            new_size = os.path.getsize(self.kb_file_path)
-            logger.info(f"✅ File write completed, new size: {new_size} bytes")
-            
-            # Update the header with new entry count
-            self._update_kb_file_header()
-            
-            logger.info(f"=== KB FILE APPEND COMPLETED ===")
+            with self._kb_file_lock:
+                fd = self._open_kb_file()
+                if os.fstat(fd).st_size == 0:
+                    logger.info("📄 File is empty, writing header")
+                    self._kb_entry_count = len(new_entries)
+                    new_text = self._kb_file_header(self._kb_entry_count) + new_text
+                else:
+                    if self._kb_entry_count is None:
+                        self._kb_entry_count = self._count_kb_file_entries()
+                    self._kb_entry_count += len(new_entries)
+                
+                # O_APPEND: the kernel positions every write at the current end of file
+                data = new_text.encode('utf-8')
+                while data:
+                    data = data[os.write(fd, data):]
+                new_size = os.fstat(fd).st_size
+                logger.info(f"✅ File write completed, new size: {new_size} bytes")
+                
+                # The header rewrite touches the whole file, so it is deferred and coalesced
+                self._kb_header_stale = True
             return True
             
         except Exception as e:
@@ -174,45 +332,197 @@ class KBService:
             logger.error(traceback.format_exc())
             return False
 
+    def _open_kb_file(self) -> int:
+        """Return the append descriptor for kb_data.txt, reopening it if the path changed or the file was removed"""
+        if self._kb_fd is not None:
+            if self._kb_fd_path == self.kb_file_path and os.fstat(self._kb_fd).st_nlink > 0:
+                return self._kb_fd
+            os.close(self._kb_fd)
+            self._kb_fd = None
+        
+        # A different or recreated file: its entries are counted again when needed
+        self._kb_entry_count = None
+        # Ensure directory exists
+        os.makedirs(os.path.dirname(self.kb_file_path), exist_ok=True)
+        self._kb_fd = os.open(self.kb_file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._kb_fd_path = self.kb_file_path
+        return self._kb_fd
+
+    def refresh_kb_file_header(self):
+        """Rewrite the header if entries were appended since it was last updated"""
+        with self._kb_file_lock:
+            if self._kb_header_stale:
+                self._update_kb_file_header()
+                self._kb_header_stale = False
+
+    def rewrite_kb_file(self, content: str):
+        """Replace kb_data.txt wholesale (admin sync), serialized with background appends"""
+        with self._kb_file_lock:
+            os.makedirs(os.path.dirname(self.kb_file_path), exist_ok=True)
+            with open(self.kb_file_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            # Same inode, so the append descriptor stays open; its entry count no longer applies
+            self._kb_entry_count = None
+            self._kb_header_stale = False
+
+    def checkpoint(self) -> bool:
+        """fsync kb_data.txt; appends are otherwise left to the page cache"""
+        self.refresh_kb_file_header()
+        with self._kb_file_lock:
+            if self._kb_fd is None:
+                return False
+            os.fsync(self._kb_fd)
+            return True
+
+    def close_kb_file(self):
+        """Bring the header up to date, then fsync and close the kb_data.txt append descriptor"""
+        self.refresh_kb_file_header()
+        with self._kb_file_lock:
+            if self._kb_fd is not None:
+                os.fsync(self._kb_fd)
+                os.close(self._kb_fd)
+                self._kb_fd = None
+
+    def _kb_file_header(self, entry_count: int) -> str:
+        return ("# Knowledge Base Entries\n"
+                f"# Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"# Total Entries: {entry_count:<{_KB_COUNT_WIDTH}}\n\n")
+
+    def _count_kb_file_entries(self) -> int:
+        """Count [KB_ID:] markers in 64 KiB chunks, carrying a tail so none is split between chunks"""
+        marker = b'[KB_ID:'
+        count = 0
+        tail = b''
+        with open(self.kb_file_path, 'rb') as f:
+            while True:
+                chunk = f.read(65536)
+                if not chunk:
+                    return count
+                data = tail + chunk
+                count += data.count(marker)
+                # The tail is shorter than the marker, so a match is never counted twice
+                tail = data[-(len(marker) - 1):]
+
     def _update_kb_file_header(self):
         """Update the KB file header with current entry count and timestamp"""
         try:
             if not os.path.exists(self.kb_file_path):
                 return
             
-            with open(self.kb_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            if self._kb_entry_count is None:
+                self._kb_entry_count = self._count_kb_file_entries()
+            header = self._kb_file_header(self._kb_entry_count).encode('utf-8')
             
-            # Count KB entries
-            entry_count = content.count('[KB_ID:')
-            
-            # Update header
-            lines = content.split('\n')
-            updated_lines = []
-            
-            for line in lines:
-                if line.startswith('# Last Updated:'):
-                    updated_lines.append(f"# Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                elif line.startswith('# Total Entries:'):
-                    updated_lines.append(f"# Total Entries: {entry_count}")
+            with open(self.kb_file_path, 'r+b') as f:
+                if _KB_HEADER_RE.match(f.read(len(header))):
+                    # Same length as the header on disk: overwrite it without touching the entries
+                    f.seek(0)
+                    f.write(header)
                 else:
-                    updated_lines.append(line)
-            
-            # Write back with updated header
-            with open(self.kb_file_path, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(updated_lines))
+                    # Older free-form header: replace it once with the fixed-width layout
+                    f.seek(0)
+                    lines = f.read().split(b'\n')
+                    while lines and lines[0].startswith(b'#'):
+                        lines.pop(0)
+                    if lines and not lines[0].strip():
+                        lines.pop(0)
+                    f.seek(0)
+                    f.write(header + b'\n'.join(lines))
+                    f.truncate()
                 
-            logger.info(f"✅ KB file header updated: {entry_count} entries")
+            logger.info(f"✅ KB file header updated: {self._kb_entry_count} entries")
             
         except Exception as e:
             logger.error(f"Error updating KB file header: {e}")
     
-    def search_kb(self, query: str, n_results: int = 5) -> Dict[str, Any]:
-        """Search knowledge base for similar entries with improved matching"""
+    def _query_embedding_key(self, query: str) -> tuple:
+        return (embedding_service.model, " ".join(query.lower().split()))
+
+    def _get_query_embedding(self, key: tuple) -> Optional[List[float]]:
+        with self._query_embed_lock:
+            cached = self._query_embed_cache.get(key)
+            if cached is None:
+                return None
+            if cached[0] <= time.monotonic():
+                del self._query_embed_cache[key]
+                return None
+            self._query_embed_cache.move_to_end(key)
+            return cached[1]
+
+    def _put_query_embedding(self, key: tuple, embedding: List[float]):
+        with self._query_embed_lock:
+            self._query_embed_cache[key] = (time.monotonic() + QUERY_EMBEDDING_CACHE_TTL, embedding)
+            self._query_embed_cache.move_to_end(key)
+            if len(self._query_embed_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embed_cache.popitem(last=False)
+
+    def match_threshold(self) -> float:
+        """Minimum enhanced (cosine) similarity for a best match; was max(0.25, 0.35 - 0.1) on the 2*cos - 1 scale"""
+        return max(0.625, self.similarity_threshold - 0.05)
+
+    def _content_words(self, text: str) -> set:
+        return set(_CONTENT_WORD_RE.findall(text.lower())) - _STOP_WORDS
+
+    def _normalize_use_case(self, text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def _register_use_case(self, kb_id: str, use_case: str):
+        self._use_case_words(kb_id, use_case)
+        if use_case:
+            self._exact_by_use_case[self._normalize_use_case(use_case)] = kb_id
+
+    def _exact_match(self, query: str) -> Optional[Dict[str, Any]]:
+        kb_id = self._exact_by_use_case.get(self._normalize_use_case(query))
+        if kb_id is None:
+            return None
+        entry = self.get_kb_entry(kb_id)
+        if not entry or self._normalize_use_case(entry['use_case']) != self._normalize_use_case(query):
+            # Deleted or changed since it was registered
+            return None
+        entry['similarity'] = entry['enhanced_similarity'] = 1.0
+        return entry
+
+    def _use_case_words(self, kb_id: str, use_case: str) -> frozenset:
+        """Lower-cased word set of an entry's use case, computed once per entry"""
+        cached = self._use_case_word_sets.get(kb_id)
+        if cached is None or cached[0] != use_case:
+            cached = self._use_case_word_sets[kb_id] = (use_case, frozenset(use_case.lower().split()))
+        return cached[1]
+
+    def _keyword_overlap(self, query_words: frozenset, use_case_words: frozenset) -> float:
+        all_words = use_case_words | query_words
+        return len(use_case_words & query_words) / len(all_words) if all_words else 0.0
+
+    def _match_data(self, kb_id: str, similarity: float, enhanced_similarity: float,
+                    metadata: Dict[str, Any], document: str) -> Dict[str, Any]:
+        return {
+            'kb_id': kb_id,
+            'similarity': similarity,
+            'enhanced_similarity': enhanced_similarity,
+            'use_case': metadata.get('use_case', ''),
+            'required_info': decode_list_metadata(metadata.get('required_info')),
+            'questions': decode_list_metadata(metadata.get('questions')),
+            'solution_steps': metadata.get('solution_steps', ''),
+            'full_text': document
+        }
+
+    def search_kb(self, query: str, n_results: int = 5, return_all: bool = False) -> Dict[str, Any]:
+        """Search knowledge base for similar entries; `matches` is only filled when return_all is set"""
         try:
             logger.info(f"🔍 Searching KB for: '{query}'")
             
-            query_embedding = embedding_service.generate_query_embedding(query)
+            exact = self._exact_match(query)
+            if exact:
+                logger.info(f"✅ EXACT MATCH: {exact['kb_id']} (no embedding or vector search needed)")
+                return {"matches": [exact] if return_all else [], "best_match": exact, "highest_enhanced_similarity": 1.0}
+            
+            query_key = self._query_embedding_key(query)
+            query_embedding = self._get_query_embedding(query_key)
+            
+            if not query_embedding:
+                query_embedding = embedding_service.generate_query_embedding(query)
+                if query_embedding:
+                    self._put_query_embedding(query_key, query_embedding)
             
             if not query_embedding:
                 logger.error("❌ Failed to generate query embedding")
@@ -229,48 +539,39 @@ class KBService:
             if results and results['ids'] and results['ids'][0]:
                 logger.info(f"📊 Found {len(results['ids'][0])} potential matches")
                 
-                for i in range(len(results['ids'][0])):
-                    kb_id = results['ids'][0][i]
-                    distance = results['distances'][0][i]
-                    metadata = results['metadatas'][0][i]
-                    document = results['documents'][0][i]
-                    
-                    similarity = 1 - distance
-                    
-                    # Calculate additional similarity factors
-                    use_case = metadata.get('use_case', '').lower()
-                    query_lower = query.lower()
-                    
-                    # Keyword overlap bonus
-                    use_case_words = set(use_case.split())
-                    query_words = set(query_lower.split())
-                    keyword_overlap = len(use_case_words.intersection(query_words)) / len(use_case_words.union(query_words)) if use_case_words.union(query_words) else 0
-                    
-                    # Enhanced similarity with keyword bonus
-                    enhanced_similarity = similarity + (keyword_overlap * 0.3)  # ✅ INCREASED bonus
-                    enhanced_similarity = min(enhanced_similarity, 1.0)
-                    
-                    logger.info(f"🎯 {kb_id}: Base={similarity:.3f}, Enhanced={enhanced_similarity:.3f}, Keywords={keyword_overlap:.3f}, Use Case: {use_case[:50]}")
-                    
-                    match_data = {
-                        'kb_id': kb_id,
-                        'similarity': similarity,
-                        'enhanced_similarity': enhanced_similarity,
-                        'use_case': metadata.get('use_case', ''),
-                        'required_info': metadata.get('required_info', '').split(','),
-                        'questions': metadata.get('questions', '').split(','),
-                        'solution_steps': metadata.get('solution_steps', ''),
-                        'full_text': document
-                    }
-                    
-                    matches.append(match_data)
-                    
-                    if enhanced_similarity > highest_similarity:
-                        highest_similarity = enhanced_similarity
-                        best_match = match_data
-            
-            # ✅ CHANGED: Dynamic threshold adjustment
-            dynamic_threshold = max(0.25, self.similarity_threshold - 0.1)  # Lower minimum to 0.25
+                ids = results['ids'][0]
+                metadatas = results['metadatas'][0]
+                documents = results['documents'][0]
+                similarities = chroma_client.distances_to_similarities(results['distances'][0])
+                
+                # Keyword overlap bonus (Jaccard of use case and query words)
+                query_words = frozenset(query.lower().split())
+                keyword_overlap = np.array([
+                    self._keyword_overlap(query_words, self._use_case_words(kb_id, metadata.get('use_case', '')))
+                    for kb_id, metadata in zip(ids, metadatas)
+                ], dtype=np.float32)
+                
+                # Enhanced similarity with keyword bonus
+                enhanced = np.minimum(similarities + keyword_overlap * KB_KEYWORD_BONUS, 1.0)
+                
+                if logger.isEnabledFor(logging.DEBUG):
+                    for i, kb_id in enumerate(ids):
+                        logger.debug(f"🎯 {kb_id}: Base={similarities[i]:.3f}, Enhanced={enhanced[i]:.3f}, Keywords={keyword_overlap[i]:.3f}, Use Case: {metadatas[i].get('use_case', '')[:50]}")
+                
+                if return_all:
+                    matches = [
+                        self._match_data(ids[i], float(similarities[i]), float(enhanced[i]), metadatas[i], documents[i])
+                        for i in range(len(ids))
+                    ]
+                
+                # Results are re-ranked, so the best match comes from the enhanced scores; only it needs its dict built
+                best = int(enhanced.argmax())
+                if enhanced[best] > highest_similarity:
+                    highest_similarity = float(enhanced[best])
+                    best_match = matches[best] if return_all else self._match_data(
+                        ids[best], float(similarities[best]), highest_similarity, metadatas[best], documents[best])
+            
+            dynamic_threshold = self.match_threshold()
             
             if best_match and best_match['enhanced_similarity'] >= dynamic_threshold:
                 logger.info(f"✅ MATCH FOUND: {best_match['kb_id']} with similarity {best_match['enhanced_similarity']:.3f} (threshold: {dynamic_threshold:.3f})")
@@ -293,18 +594,31 @@ class KBService:
     def get_kb_entry(self, kb_id: str) -> Optional[Dict[str, Any]]:
         """Get specific KB entry by ID"""
         try:
+            kb_id = str(kb_id).strip()
+            with self._kb_entry_lock:
+                cached = self._kb_entry_cache.get(kb_id)
+                if cached is not None:
+                    self._kb_entry_cache.move_to_end(kb_id)
+                    return dict(cached)
+            
             entry = chroma_client.get_entry_by_id(kb_id)
             
             if entry:
                 metadata = entry['metadata']
-                return {
+                kb_entry = {
                     'kb_id': kb_id,
                     'use_case': metadata.get('use_case', ''),
-                    'required_info': metadata.get('required_info', '').split(','),
-                    'questions': metadata.get('questions', '').split(','),
+                    'required_info': decode_list_metadata(metadata.get('required_info')),
+                    'questions': decode_list_metadata(metadata.get('questions')),
                     'solution_steps': metadata.get('solution_steps', ''),
                     'full_text': entry['document']
                 }
+                
+                with self._kb_entry_lock:
+                    self._kb_entry_cache[kb_id] = kb_entry
+                    if len(self._kb_entry_cache) > KB_ENTRY_CACHE_SIZE:
+                        self._kb_entry_cache.popitem(last=False)
+                return dict(kb_entry)
             
             return None
             
@@ -312,22 +626,100 @@ class KBService:
             logger.error(f"Error getting KB entry: {e}")
             return None
     
+    def invalidate_kb_entry(self, kb_id: str):
+        """Drop a KB entry from the lookup cache after it changes"""
+        with self._kb_entry_lock:
+            self._kb_entry_cache.pop(str(kb_id).strip(), None)
+    
+    def _default_question(self, info: str) -> str:
+        info_lower = info.lower()
+        return next(
+            (question for keywords, question in _QUESTION_RULES if any(k in info_lower for k in keywords)),
+            f"Can you provide information about: {info}?"
+        )
+
+    def _max_kb_number(self) -> int:
+        """Highest KB_<n> number stored in ChromaDB (full scan)"""
+        max_id = 0
+        for entry in chroma_client.get_all_entries():
+            kb_id = entry['id']
+            if kb_id.startswith('KB_'):
+                try:
+                    num = int(kb_id.split('_')[1])
+                    max_id = max(max_id, num)
+                except:
+                    pass
+        return max_id
+
+    def _next_kb_id(self) -> str:
+        """Allocate the next KB id from the Mongo counter; scans ChromaDB only to seed it"""
+        if not self._kb_counter_seeded:
+            self._kb_counter_seeded = mongo_client.seed_counter(KB_ID_COUNTER, self._max_kb_number())
+        seq = mongo_client.next_sequence(KB_ID_COUNTER) if self._kb_counter_seeded else None
+        if seq is None:
+            seq = self._max_kb_number() + 1
+        return f"KB_{seq}"
+    
     def add_new_kb_entry(self, use_case: str, required_info: List[str],
                         solution_steps: str, questions: List[str] = None) -> Optional[str]:
         """Add a new KB entry (for approved incidents)"""
         try:
-            all_entries = chroma_client.get_all_entries()
-            max_id = 0
-            for entry in all_entries:
-                kb_id = entry['id']
-                if kb_id.startswith('KB_'):
-                    try:
-                        num = int(kb_id.split('_')[1])
-                        max_id = max(max_id, num)
-                    except:
-                        pass
-            
-            new_kb_id = f"KB_{max_id + 1}"
+            new_kb_id = self._next_kb_id()
+            if self._index_kb_entry(new_kb_id, use_case, required_info, solution_steps, questions):
+                return new_kb_id
+            return None
+        except Exception as e:
+            logger.error(f"Error adding new KB entry: {e}")
+            return None
+    
+    def submit_new_kb_entry(self, use_case: str, required_info: List[str],
+                            solution_steps: str, questions: List[str] = None) -> Optional[str]:
+        """Assign a kb_id now and embed + index the entry in the background"""
+        try:
+            new_kb_id = self._next_kb_id()
+            entry = {
+                'kb_id': new_kb_id,
+                'use_case': use_case,
+                'required_info': list(required_info),
+                'solution_steps': solution_steps,
+                'questions': list(questions or [])
+            }
+            
+            # The pending record survives a restart; without it, index before returning
+            if not mongo_client.add_pending_kb_entry(entry):
+                return new_kb_id if self._index_kb_entry(**entry) else None
+            
+            self._indexer.submit(self._index_pending_kb_entry, entry)
+            return new_kb_id
+            
+        except Exception as e:
+            logger.error(f"Error submitting new KB entry: {e}")
+            return None
+    
+    def resume_pending_kb_entries(self) -> int:
+        """Queue the entries a previous process assigned but never indexed"""
+        entries = mongo_client.get_pending_kb_entries()
+        for entry in entries:
+            self._indexer.submit(self._index_pending_kb_entry, entry)
+        if entries:
+            logger.info(f"Resuming indexing of {len(entries)} pending KB entries")
+        return len(entries)
+    
+    def shutdown_indexer(self):
+        """Wait for queued KB entries to be indexed"""
+        self._indexer.shutdown(wait=True)
+    
+    def _index_pending_kb_entry(self, entry: Dict[str, Any]):
+        if self._index_kb_entry(**entry):
+            mongo_client.remove_pending_kb_entry(entry['kb_id'])
+        else:
+            logger.error(f"Indexing KB entry {entry['kb_id']} failed; it stays pending until the next restart")
+    
+    def _index_kb_entry(self, kb_id: str, use_case: str, required_info: List[str], solution_steps: str,
+                        questions: List[str] = None) -> bool:
+        """Embed a KB entry and add it to ChromaDB under the given kb_id"""
+        try:
+            new_kb_id = kb_id
             
             # Handle solution_steps if it's a list
             if isinstance(solution_steps, list):
@@ -337,46 +729,36 @@ class KBService:
             
             full_text = f"Use Case: {use_case}\nRequired Info: {', '.join(required_info)}\nSolution Steps: {solution_text}"
             
-            embedding = embedding_service.generate_embedding(use_case)
+            embedding = self._cached_embed(use_case)
             
             if not embedding:
                 logger.error("Failed to generate embedding for new KB entry")
-                return None
+                return False
             
             # Generate questions if not provided
             if not questions:
-                questions = []
-                for info in required_info:
-                    info_lower = info.lower()
-                    if 'operating system' in info_lower or 'os' in info_lower:
-                        questions.append("What operating system are you using?")
-                    elif 'error message' in info_lower or 'error code' in info_lower:
-                        questions.append("Are you seeing any error messages? If yes, what does it say?")
-                    elif 'account type' in info_lower:
-                        questions.append("What type of account is this?")
-                    elif 'device' in info_lower:
-                        questions.append("What is your device name or ID?")
-                    else:
-                        questions.append(f"Can you provide information about: {info}?")
+                questions = [self._default_question(info) for info in required_info]
             
             metadata = {
                 'use_case': use_case,
-                'required_info': ','.join(required_info),
-                'questions': ','.join(questions),
+                'required_info': encode_list_metadata(required_info),
+                'questions': encode_list_metadata(questions),
                 'solution_steps': solution_text
             }
             
             success = chroma_client.add_kb_entry(new_kb_id, full_text, embedding, metadata)
             
             if success:
+                self._extend_vocabulary([f"{use_case} {' '.join(required_info)}"])
+                self._register_use_case(new_kb_id, use_case)
                 logger.info(f"Added new KB entry: {new_kb_id}")
-                return new_kb_id
+                return True
             
-            return None
+            return False
             
         except Exception as e:
-            logger.error(f"Error adding new KB entry: {e}")
-            return None
+            logger.error(f"Error indexing KB entry {kb_id}: {e}")
+            return False
     
     def update_kb_entry(self, kb_id: str, solution_steps: str) -> bool:
         """Update solution steps for a KB entry"""
@@ -391,7 +773,10 @@ class KBService:
             
             full_text = f"Use Case: {entry['use_case']}\nRequired Info: {', '.join(entry['required_info'])}\nSolution Steps: {solution_steps}"
             
-            embedding = embedding_service.generate_embedding(entry['use_case'])
+            # use_case is unchanged, so this is an embedding-cache hit rather than an API call.
+            # The vector is still sent: updating the document without it would make ChromaDB
+            # re-embed the text with the collection's default embedding function.
+            embedding = self._cached_embed(entry['use_case'])
             
             if not embedding:
                 logger.error("Failed to generate embedding for updated KB entry")
@@ -399,12 +784,13 @@ class KBService:
             
             metadata = {
                 'use_case': entry['use_case'],
-                'required_info': ','.join(entry['required_info']),
-                'questions': ','.join(entry['questions']),
+                'required_info': encode_list_metadata(entry['required_info']),
+                'questions': encode_list_metadata(entry['questions']),
                 'solution_steps': solution_steps
             }
             
             success = chroma_client.update_entry(kb_id, full_text, embedding, metadata)
+            self.invalidate_kb_entry(kb_id)
             
             if success:
                 logger.info(f"Updated KB entry: {kb_id}")
@@ -416,5 +802,72 @@ class KBService:
             logger.error(f"Error updating KB entry: {e}")
             return False
 
+
+class KBAppendWriter:
+    """Background writer that coalesces kb_data.txt appends into batched writes"""
+    
+    def __init__(self, service: KBService, batch_window: float = KB_APPEND_BATCH_WINDOW,
+                 max_batch: int = KB_APPEND_MAX_BATCH):
+        self.service = service
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def submit(self, kb_id: str, use_case: str, required_info: List[str], solution_steps: List[str]) -> threading.Event:
+        """Queue a KB entry for appending; the returned event is set once it is on disk"""
+        self._ensure_started()
+        done = threading.Event()
+        self._queue.put((kb_id, use_case, required_info, solution_steps, done))
+        return done
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything submitted so far has been written"""
+        if self._thread is None:
+            return True
+        # An empty marker item fires only after every earlier item is written
+        done = threading.Event()
+        self._queue.put((None, None, None, None, done))
+        return done.wait(timeout)
+    
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="kb-append-writer", daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            entries = [
+                self.service._format_kb_entry(kb_id, use_case, required_info, solution_steps)
+                for kb_id, use_case, required_info, solution_steps, _ in batch
+                if kb_id is not None
+            ]
+            if entries:
+                logger.info(f"Writing {len(entries)} queued KB entries to file")
+                self.service._write_kb_entries(entries)
+            if self._queue.empty():
+                # Only once the burst of appends is over
+                self.service.refresh_kb_file_header()
+            
+            for *_, done in batch:
+                done.set()
+
+
 # Global KB service instance
-kb_service = KBService()
\ No newline at end of file
+kb_service = KBService()
+
+# Global KB file writer instance
+kb_writer = KBAppendWriter(kb_service)
\ No newline at end of file
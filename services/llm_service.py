@@ -1,10 +1,11 @@
 # backend/services/llm_service.py
 import google.generativeai as genai
 from core.config import settings
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 import logging
 import json
 import re
+import threading
 from utils.prompts import INTENT_DETECTION_PROMPT
         
 
@@ -13,9 +14,43 @@ logger = logging.getLogger(__name__)
 # Configure Gemini
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
+# Words that make up greetings and small talk, which never need a KB search
+SMALL_TALK_WORDS = frozenset({
+    'hi', 'hello', 'hey', 'hii', 'yo', 'thanks', 'thank', 'you', 'thx', 'ty',
+    'ok', 'okay', 'cool', 'great', 'nice', 'bye', 'goodbye', 'good', 'morning',
+    'afternoon', 'evening', 'night', 'there', 'cheers', 'yes', 'no', 'sure'
+})
+
+_NO_LETTERS_RE = re.compile(r'[\W\d_]*')
+
+# Unambiguous whole-message commands classified without an LLM call, checked in order
+_END = r'[\s!.,:]*$'
+LOCAL_INTENT_RULES = (
+    ('GREETING', re.compile(r'^\s*(hi+|hello|hey|good (morning|afternoon|evening))(\s+there)?' + _END, re.IGNORECASE)),
+    ('CLEAR_SESSION', re.compile(r'^\s*(clear( the| my)? session|reset( session)?|start (over|fresh)|new session)' + _END, re.IGNORECASE)),
+    ('CLOSE_INCIDENT', re.compile(r'^\s*close (this |the |my )?incident' + _END, re.IGNORECASE)),
+    ('TRACK_INCIDENT', re.compile(r'^\s*track( an| my)? incidents?' + _END, re.IGNORECASE)),
+    ('ASK_INCIDENT_TYPE', re.compile(
+        r'^\s*(i want to |i would like to |please )?(create|open|raise|report)( a| an)?( new)? (incident|ticket|issue)( for)?' + _END,
+        re.IGNORECASE)),
+    ('PROVIDE_INCIDENT_ID', re.compile(r'^\s*(INC\d+)' + _END)),
+)
+
+# Phrases that mean the user is asking about an earlier incident
+PREVIOUS_SOLUTION_KEYWORDS = (
+    'previous', 'last', 'earlier', 'before', 'my incident', 'solution',
+    'what happened', 'status', 'view solution', 'continue my', 'old incident',
+    'past incident', 'earlier issue'
+)
+
+LLM_FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request. Please try again."
+
 class LLMService:
     def __init__(self):
         self.model = genai.GenerativeModel('gemini-2.0-flash')
+        # The "what is the issue?" prompt is templated, so one generated reply is reused
+        self._ask_incident_type_response: Optional[str] = None
+        self._ask_incident_type_lock = threading.Lock()
     
     def generate_response(self, prompt: str, temperature: float = 0.7) -> str:
         """Generate response from LLM"""
@@ -32,7 +67,7 @@ class LLMService:
             return response.text
         except Exception as e:
             logger.error(f"Error generating LLM response: {e}")
-            return "I apologize, but I'm having trouble processing your request. Please try again."
+            return LLM_FALLBACK_RESPONSE
     
     # In backend/services/llm_service.py - Update the intent detection
 
@@ -42,6 +77,11 @@ class LLMService:
         """Detect user intent using LLM with improved context awareness - ALWAYS returns a dict"""
         
         try:
+            local_intent = self._local_intent(user_input, conversation_history)
+            if local_intent:
+                logger.info(f"✅ Detected intent locally: {local_intent['intent']}")
+                return local_intent
+            
             # Check for new issue descriptions when there's an active incident
             if has_active_incident:
                 user_lower = user_input.lower().strip()
@@ -161,15 +201,43 @@ class LLMService:
         user_words = set(re.findall(r'\b\w+\b', user_input.lower()))
         return len(user_words.intersection(tech_keywords)) > 0
     
+    def is_small_talk(self, user_input: str) -> bool:
+        """Cheap local check for short greetings/small talk before any KB or LLM call"""
+        if _NO_LETTERS_RE.fullmatch(user_input):
+            # Only digits/punctuation ("?", "123", "...") - nothing to search for
+            return True
+        user_words = re.findall(r'\b\w+\b', user_input.lower())
+        if len(user_words) >= 3 or self._is_technical_query(user_input):
+            return False
+        return all(word in SMALL_TALK_WORDS for word in user_words)
+    
     def _is_asking_about_previous_solution(self, user_input: str) -> bool:
         """Check if user is asking about previous incidents/solutions"""
-        previous_keywords = {
-            'previous', 'last', 'earlier', 'before', 'my incident', 'solution', 
-            'what happened', 'status', 'view solution', 'continue my', 'old incident',
-            'past incident', 'earlier issue'
-        }
-        user_lower = user_input.lower()
-        return any(keyword in user_lower for keyword in previous_keywords)
+        # Most chat input is already lowercase ASCII; skip the copy then
+        if user_input.isascii() and user_input.islower():
+            user_lower = user_input
+        else:
+            user_lower = user_input.lower()
+        for keyword in PREVIOUS_SOLUTION_KEYWORDS:
+            if keyword in user_lower:
+                return True
+        return False
+    
+    def _local_intent(self, user_input: str, conversation_history: List[Dict]) -> Optional[Dict[str, Any]]:
+        """Classify unambiguous commands with regexes; None means ask the LLM"""
+        for intent, pattern in LOCAL_INTENT_RULES:
+            match = pattern.match(user_input)
+            if not match:
+                continue
+            if intent == 'PROVIDE_INCIDENT_ID':
+                # An ID answering "which incomplete incident?" is ASK_INCOMPLETE_INCIDENT; let the LLM decide
+                last_msg = conversation_history[-1] if conversation_history else {}
+                if last_msg.get('role') == 'assistant' and 'incomplete' in last_msg.get('content', '').lower():
+                    return None
+                return {"intent": intent, "confidence": 0.95, "reasoning": "local rule",
+                        "extracted_incident_id": match.group(1)}
+            return {"intent": intent, "confidence": 0.95, "reasoning": "local rule"}
+        return None
     
     # In services/llm_service.py - Update the _fallback_intent_detection method
 
@@ -311,14 +379,26 @@ class LLMService:
         """Generate response asking what type of issue user wants to report"""
         from utils.prompts import ASK_INCIDENT_TYPE_PROMPT
         
-        conv_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history[-5:]])
+        if self._ask_incident_type_response is not None:
+            return self._ask_incident_type_response
         
-        prompt = ASK_INCIDENT_TYPE_PROMPT.format(
-            user_input=user_input,
-            conversation_history=conv_text
-        )
+        with self._ask_incident_type_lock:
+            if self._ask_incident_type_response is not None:
+                return self._ask_incident_type_response
+            
+            conv_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history[-5:]])
+            
+            prompt = ASK_INCIDENT_TYPE_PROMPT.format(
+                user_input=user_input,
+                conversation_history=conv_text
+            )
+            
+            response = self.generate_response(prompt, temperature=0.7)
+            # Don't pin the error fallback; retry the LLM next time
+            if response != LLM_FALLBACK_RESPONSE:
+                self._ask_incident_type_response = response
+            return response
     
-        return self.generate_response(prompt, temperature=0.7)  
     def analyze_technical_issue(self, user_query: str, conversation_history: List[Dict[str, str]]) -> Dict[str, Any]:
         """Analyze if query is a technical issue and what info is needed"""
         from utils.prompts import NEW_INCIDENT_ANALYSIS_PROMPT
@@ -362,8 +442,9 @@ class LLMService:
         response = self.generate_response(prompt, temperature=0.7)
         return response
     
-    def handle_general_query(self, user_input: str, conversation_history: List[Dict]) -> str:
-        """Handle general non-technical queries"""
+    def handle_general_query(self, user_input: str, conversation_history: List[Dict],
+                             on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Handle general non-technical queries; streams chunks to on_token when given"""
         from utils.prompts import GENERAL_QUERY_PROMPT
         
         try:
@@ -374,8 +455,17 @@ class LLMService:
                 conversation_history=conv_text
             )
             
-            response = self.model.generate_content(prompt)
-            return response.text
+            if on_token is None:
+                response = self.model.generate_content(prompt)
+                return response.text
+            
+            parts = []
+            for chunk in self.model.generate_content(prompt, stream=True):
+                text = chunk.text
+                if text:
+                    parts.append(text)
+                    on_token(text)
+            return "".join(parts)
             
         except Exception as e:
             logger.error(f"Error handling general query: {e}")
@@ -462,12 +552,14 @@ class LLMService:
         
         conv_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history[-5:]])
         
-        incident_conversation = current_incident.get('conversation_history', []) if current_incident else []
         last_question = ""
-        for msg in reversed(incident_conversation):
-            if msg.get('role') == 'assistant':
-                last_question = msg.get('content', '')
-                break
+        if current_incident:
+            last_question = current_incident.get('last_assistant_question', '')
+            if not last_question:
+                for msg in reversed(current_incident.get('conversation_history', [])):
+                    if msg.get('role') == 'assistant':
+                        last_question = msg.get('content', '')
+                        break
         
         prompt = GREETING_WITH_CONTEXT_PROMPT.format(
             user_input=user_input,
@@ -0,0 +1,102 @@
+# backend/services/semantic_cache.py
+from services.embedding_wrapper import embedding_service
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_THRESHOLD = 0.88  # cosine similarity needed to reuse a response
+SEMANTIC_CACHE_TTL = 600  # seconds a cached response stays valid
+SEMANTIC_CACHE_SCOPE_SIZE = 64  # responses kept per scope
+SEMANTIC_CACHE_MAX_SCOPES = 1024
+
+
+class SemanticResponseCache:
+    """In-process cache of LLM responses, matched by query embedding similarity within a scope"""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.ttl = ttl
+        # scope -> OrderedDict[normalized query -> (expires_at, unit vector, response)]
+        self._scopes: "OrderedDict[str, OrderedDict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _normalize(self, text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        embedding = embedding_service.generate_query_embedding(text)
+        if not embedding:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, scope: str, query: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (cached response or None, query vector to pass back to set())"""
+        key = self._normalize(query)
+        now = time.monotonic()
+
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries:
+                # Drop expired responses before matching
+                for cached_key in [k for k, (expires_at, _, _) in entries.items() if expires_at <= now]:
+                    del entries[cached_key]
+                # Exact repeat: no embedding call needed
+                if key in entries:
+                    _, vector, response = entries[key]
+                    return response, vector
+                if not entries:
+                    return None, None
+                keys = list(entries.keys())
+                matrix = np.stack([entries[k][1] for k in keys])
+            else:
+                return None, None
+
+        vector = self._embed(key)
+        if vector is None:
+            return None, None
+
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            logger.info(f"Semantic cache hit ({similarities[best]:.3f}) for: '{query[:50]}'")
+            with self._lock:
+                entry = self._scopes.get(scope, {}).get(keys[best])
+            if entry:
+                return entry[2], vector
+        return None, vector
+
+    def set(self, scope: str, query: str, response: str, vector: Optional[np.ndarray] = None):
+        """Store a response; reuses the vector from get() when available"""
+        key = self._normalize(query)
+        if vector is None:
+            vector = self._embed(key)
+            if vector is None:
+                return
+
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries is None:
+                entries = self._scopes[scope] = OrderedDict()
+                if len(self._scopes) > SEMANTIC_CACHE_MAX_SCOPES:
+                    self._scopes.popitem(last=False)
+            else:
+                self._scopes.move_to_end(scope)
+            entries[key] = (time.monotonic() + self.ttl, vector, response)
+            if len(entries) > SEMANTIC_CACHE_SCOPE_SIZE:
+                entries.popitem(last=False)
+
+    def invalidate(self, scope: str):
+        """Forget every cached response for a scope"""
+        with self._lock:
+            self._scopes.pop(scope, None)
+
+
+# Global semantic response cache instance
+semantic_cache = SemanticResponseCache()
@@ -0,0 +1,127 @@
+# backend/services/session_buffer.py
+from db.mongo import mongo_client
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, wait as futures_wait
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SESSION_CONTEXT_LIMIT = 10  # messages kept in a session's conversation_context
+SESSION_FLUSH_INTERVAL = 0.2  # seconds between background flushes
+SESSION_FLUSH_THRESHOLD = 8  # pending messages for one session that trigger an early flush
+SESSION_WRITER_THREADS = 8
+
+
+class SessionContextBuffer:
+    """Write-behind buffer that coalesces conversation_context appends into bulk writes"""
+
+    def __init__(self, flush_interval: float = SESSION_FLUSH_INTERVAL,
+                 flush_threshold: int = SESSION_FLUSH_THRESHOLD):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending: Dict[str, List[Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+        # Held while pending messages are drained and written, so a synchronous
+        # flush never returns while the background thread is mid-write
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]):
+        """Queue messages to be pushed onto a session's conversation context"""
+        self._ensure_started()
+        with self._lock:
+            pending = self._pending.setdefault(session_id, [])
+            pending.extend(messages)
+            if len(pending) >= self.flush_threshold:
+                self._wakeup.set()
+
+    def flush(self, session_id: str):
+        """Write one session's pending messages now (read-after-write)"""
+        with self._write_lock:
+            with self._lock:
+                messages = self._pending.pop(session_id, None)
+            if messages:
+                mongo_client.append_conversation(session_id, messages, SESSION_CONTEXT_LIMIT)
+
+    def flush_all(self):
+        """Write every pending message now"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if pending:
+                mongo_client.append_conversations(pending, SESSION_CONTEXT_LIMIT)
+
+    def discard(self, session_id: str):
+        """Drop pending messages for a session whose context is being reset"""
+        # Wait out an in-flight flush, so its $push lands before the caller resets the context
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(session_id, None)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="session-context-flusher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush_all()
+            except Exception as e:
+                logger.error(f"Error flushing session context: {e}")
+
+
+# Global session context buffer instance
+session_buffer = SessionContextBuffer()
+
+
+class SessionWriteQueue:
+    """Runs fire-and-forget Mongo writes on a thread pool, in submission order per session"""
+
+    def __init__(self, max_workers: int = SESSION_WRITER_THREADS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session-writer")
+        # Most recent write queued for each session; the next one waits on it
+        self._tails: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id: str, fn: Callable, *args, **kwargs) -> Future:
+        """Queue a write that runs after every earlier write for the same session"""
+        with self._lock:
+            previous = self._tails.get(session_id)
+            future = self._pool.submit(self._run_after, previous, fn, args, kwargs)
+            self._tails[session_id] = future
+        future.add_done_callback(lambda f: self._release(session_id, f))
+        return future
+
+    def wait(self, session_id: str, timeout: Optional[float] = None):
+        """Block until the session's queued writes have been applied (read-after-write)"""
+        with self._lock:
+            tail = self._tails.get(session_id)
+        if tail is not None:
+            futures_wait([tail], timeout=timeout)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+    def _run_after(self, previous: Optional[Future], fn: Callable, args: tuple, kwargs: dict):
+        # The pool is FIFO, so the previous write has already started or finished
+        if previous is not None:
+            futures_wait([previous])
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Error in background session write {getattr(fn, '__name__', fn)}: {e}")
+
+    def _release(self, session_id: str, future: Future):
+        with self._lock:
+            if self._tails.get(session_id) is future:
+                del self._tails[session_id]
+
+
+# Global background session writer instance
+session_writer = SessionWriteQueue()
@@ -0,0 +1,32 @@
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pymongo")
+pytest.importorskip("chromadb")
+
+from db.chroma import ChromaDBClient
+from services.kb_service import KBService
+
+
+def _unit_pair(cosine):
+    return np.array([1.0, 0.0]), np.array([cosine, math.sqrt(1.0 - cosine ** 2)])
+
+
+@pytest.mark.parametrize("cosine", [0.2, 0.5, 0.62, 0.63, 0.67, 0.68, 0.95])
+def test_l2_and_cosine_collections_make_the_same_match_decision(cosine):
+    a, b = _unit_pair(cosine)
+    threshold = KBService().match_threshold()
+    client = ChromaDBClient()
+
+    client.distance_space = "l2"
+    from_l2 = float(client.distances_to_similarities([float(np.sum((a - b) ** 2))])[0])
+    client.distance_space = "cosine"
+    from_cosine = float(client.distances_to_similarities([1.0 - float(a @ b)])[0])
+
+    assert from_l2 == pytest.approx(cosine, abs=1e-5)
+    assert from_cosine == pytest.approx(cosine, abs=1e-5)
+    # Same cutoff as the previous "1 - squared L2 >= 0.25" rule
+    old_decision = 1.0 - float(np.sum((a - b) ** 2)) >= 0.25
+    assert (from_l2 >= threshold) == (from_cosine >= threshold) == old_decision
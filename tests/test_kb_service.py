@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("chromadb")
+
+from services.kb_service import KBService
+
+
+@pytest.fixture
+def kb():
+    service = KBService()
+    service._extend_vocabulary(["VPN not connecting", "SSO login broken", "MFA prompt not received"])
+    return service
+
+
+@pytest.mark.parametrize("query", ["vpn down", "sso broken", "mfa failing"])
+def test_short_query_with_three_letter_kb_term_is_searched(kb, query):
+    assert kb.might_match(query)
+    assert kb.should_search(query)
+
+
+def test_short_off_kb_query_skips_search(kb):
+    assert not kb.should_search("printer jammed")
+
+
+def test_stop_words_do_not_count_as_a_match(kb):
+    assert not kb.might_match("not the")
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+import services.session_buffer as session_buffer_module
+from services.session_buffer import SessionContextBuffer
+
+
+class _FakeMongo:
+    """Records conversation contexts; append_conversations blocks until released"""
+
+    def __init__(self):
+        self.contexts = {}
+        self.write_started = threading.Event()
+        self.release_write = threading.Event()
+
+    def append_conversations(self, pending, max_messages):
+        self.write_started.set()
+        self.release_write.wait(5)
+        for session_id, messages in pending.items():
+            self.contexts.setdefault(session_id, []).extend(messages)
+
+
+def test_clear_while_flushing_does_not_resurrect_history(monkeypatch):
+    mongo = _FakeMongo()
+    monkeypatch.setattr(session_buffer_module, "mongo_client", mongo)
+    buffer = SessionContextBuffer(flush_interval=60)
+    buffer._ensure_started = lambda: None  # drive flushes from the test only
+    buffer.append("s1", [{"role": "user", "content": "old message"}])
+
+    flusher = threading.Thread(target=buffer.flush_all)
+    flusher.start()
+    assert mongo.write_started.wait(5)
+
+    def clear_session():
+        buffer.discard("s1")
+        mongo.contexts["s1"] = []
+
+    clearer = threading.Thread(target=clear_session)
+    clearer.start()
+    clearer.join(0.2)
+    assert clearer.is_alive(), "discard must wait for the in-flight flush"
+
+    mongo.release_write.set()
+    flusher.join(5)
+    clearer.join(5)
+    assert mongo.contexts["s1"] == []
@@ -26,16 +26,6 @@ Guidelines:
 
 INTENT_DETECTION_PROMPT = """Analyze the user's message to detect their intent. Consider the conversation context.
 
-User Message: {user_input}
-
-Conversation History:
-{conversation_history}
-
-Current Context:
-- Has active incident: {has_active_incident}
-- Session ID: {session_id}
-- Is right after greeting: {is_after_greeting}
-
 CRITICAL RULES FOR INTENT DETECTION:
 
 1. **ASK_INCIDENT_TYPE vs NEW_INCIDENT - VERY IMPORTANT:**
@@ -100,7 +90,17 @@ Respond in JSON format with these exact keys:
    "intent": "PRIMARY_INTENT",
    "confidence": 0.9,
    "reasoning": "brief explanation"
-}}"""
+}}
+
+Current Context:
+- Has active incident: {has_active_incident}
+- Session ID: {session_id}
+- Is right after greeting: {is_after_greeting}
+
+Conversation History:
+{conversation_history}
+
+User Message: {user_input}"""
 
 GREETING_RESPONSE_PROMPT = """Generate a warm greeting response and ask how you can help.
 